@@ -1,10 +1,10 @@
-from flask import Flask, request, jsonify, send_file, abort
+from flask import Flask, request, jsonify, send_file, abort, Response, stream_with_context
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt, get_jwt_identity
 from models import *
-from datetime import timedelta
+from datetime import date, datetime, timedelta
 import os
-from docxtpl import DocxTemplate, RichText, Subdoc
+from docxtpl import RichText, Subdoc
 import pandas as pd
 import traceback
 import numpy as np
@@ -17,7 +17,38 @@ import re
 from werkzeug.utils import secure_filename
 from urllib.parse import quote
 import random
+import multiprocessing
+import threading
+import uuid
+import hmac
+import click
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from docx import Document
+from rendering import (
+    DOCX_MIMETYPE, checklist_context, checklist_file_name, docx_context, docx_file_name,
+    init_bulk_worker, isms_context, isms_file_name, render_bulk_row, render_docx, render_template
+)
+from archive import stream_zip
+from frame_query import QueryError, query_frame
+from keyset import encode_cursor, keyset_page, keyset_query, wants_keyset
+from auth_cache import UserState, UserStateCache
+from blobstore import blob_store_from_env
+from chunked_uploads import (
+    ChunkTooLarge, content_path, file_sha256, part_path, received_bytes, save_hashed, store_part, write_chunk
+)
+from migrations import SchemaUpgradeError, upgrade_schema
+from db_pool import PoolMetrics, engine_options, pool_settings
+from metrics import PROMETHEUS_CONTENT_TYPE, RequestMetrics, instrumented, phase, stats_gauges
+from render_cache import RenderCache, render_key
+from template_registry import TemplateRegistry
+from jobs import (
+    enqueue_job, finished_row_ids, job_handler, job_to_dict, report_progress, start_worker_threads
+)
+from row_reader import StreamedWorkbook, can_stream, read_header, read_vertical_fields
+from workbook_cache import (
+    MASTER_SHEET_NAMES, WorkbookCache, parse_workbook, read_sidecar, vertical_records, write_sidecar
+)
 
 load_dotenv()
 
@@ -27,11 +58,21 @@ CORS(app, supports_credentials=True,)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv(
     'DATABASE_URL')
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+
+# Pool sizing, recycle and pre-ping come from DB_POOL_*; see db_pool.py
+DB_POOL_SETTINGS = pool_settings()
+pool_metrics = PoolMetrics()
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+    app.config["SQLALCHEMY_DATABASE_URI"], DB_POOL_SETTINGS, pool_metrics
+)
 app.config["SECRET_KEY"] = os.getenv("SECRET_KEY")
 
 app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY")
 app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=2)
 
+# bcrypt work factor for new hashes; existing ones are rehashed at the next login
+app.config["BCRYPT_LOG_ROUNDS"] = int(os.getenv("BCRYPT_LOG_ROUNDS", "12"))
+
 db.init_app(app)
 bcrypt.init_app(app)
 jwt = JWTManager(app)
@@ -44,14 +85,77 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMPLATE_FILE = "D:/Anurag/Office/KVQA KAF Data Upload Application/backend/templates/template.docx"  # path to your Word template
 OUTPUT_DIR = "generated_docs"
 
+# Generated documents are served from the blob store; set KEEP_GENERATED_ON_DISK=1
+# to also keep a plain copy of each one in OUTPUT_DIR
+KEEP_GENERATED_ON_DISK = os.getenv("KEEP_GENERATED_ON_DISK", "0") == "1"
+
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+blob_store = blob_store_from_env()
+
+workbook_cache = WorkbookCache(
+    max_bytes=int(os.getenv("WORKBOOK_CACHE_MAX_MB", "256")) * 1024 * 1024,
+    max_entries=int(os.getenv("WORKBOOK_CACHE_MAX_ENTRIES", "32")),
+)
+
+# Single-row lookups in uploads at least this large that are not already in
+# workbook_cache stream the file instead of parsing every sheet of it
+STREAM_LOOKUP_MIN_BYTES = int(float(os.getenv("STREAM_LOOKUP_MIN_MB", "10")) * 1024 * 1024)
+
+# Role and username ride in the access token as claims; user_states re-checks
+# them against the database at most once per AUTH_CACHE_TTL_SECONDS per user.
+# Whatever creates, changes or deletes a User calls user_states.invalidate(id)
+# once committed, so this process sees it at once (the others within the TTL).
+AUTH_CACHE_TTL_SECONDS = int(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+
+# Per-phase timings of the generation, upload and row endpoints (see metrics.py);
+# REQUEST_LOG=1 also prints one JSON line per traced request
+REQUEST_LOG = os.getenv("REQUEST_LOG", "0") == "1"
+# /metrics answers requests bearing METRICS_TOKEN. METRICS_ALLOW_LOCAL=1 also
+# lets loopback callers in without it: only for a server nothing proxies to,
+# since behind a reverse proxy on the same host every request is "local".
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+METRICS_ALLOW_LOCAL = os.getenv("METRICS_ALLOW_LOCAL", "0") == "1"
+request_metrics = RequestMetrics()
+
+
+def traced(operation):
+    return instrumented(operation, request_metrics, log_requests=REQUEST_LOG)
+
+
+def load_user_state(user_id):
+    row = db.session.query(User.role, User.username).filter(User.id == user_id).first()
+    return UserState(row.role, row.username) if row else None
+
+
+user_states = UserStateCache(load_user_state, ttl=AUTH_CACHE_TTL_SECONDS)
+
+
+def token_claims(user):
+    return {"role": user.role, "username": user.username}
+
+
+def current_user_state():
+    """
+    Role and username of the request's user, or None when the user is gone
+    or has changed since the token was issued.
+    """
+    state = user_states.get(int(get_jwt_identity()))
+    if state is None:
+        return None
+
+    claims = get_jwt()
+    # Tokens issued before role/username were claims are judged on the state alone
+    if "role" in claims and (claims["role"], claims.get("username")) != tuple(state):
+        return None
+    return state
+
+
 def admin_required(fn):
     @wraps(fn)
     @jwt_required()
     def wrapper(*args, **kwargs):
-        current_user_id = int(get_jwt_identity())
-        user = User.query.get(current_user_id)
+        user = current_user_state()
         if not user or user.role != "admin":
             return {"error": "Admin access required"}, 403
         return fn(*args, **kwargs)
@@ -62,14 +166,18 @@ def seed_initial_admin():
         {"username": "admin", "password": "admin123", "role": "admin"},
     ]
 
+    created = []
     for data in admins_data:
         existing_user = User.query.filter_by(username=data["username"]).first()
         if not existing_user:
             user = User(username=data["username"], role=data["role"])
             user.set_password(data["password"])
             db.session.add(user)
+            created.append(user)
 
     db.session.commit()
+    for user in created:
+        user_states.invalidate(user.id)
     print("✅ Admin user(s) seeded successfully!")
 
 with app.app_context():
@@ -86,35 +194,45 @@ def read_vertical_excel_as_df(file_path, engine="openpyxl"):
     - Column 1..N = values for each record
     - Each record can occupy multiple columns (like Excel export)
     """
-    import pandas as pd
-
     # Read Excel without header
     df_raw = pd.read_excel(file_path, engine=engine, header=None, keep_default_na=False)
 
-    # Drop fully empty rows
-    df_raw = df_raw.dropna(how="all")
+    return vertical_records(df_raw)
 
-    if df_raw.shape[1] < 2:
-        raise ValueError("Excel must have at least two columns (field, value)")
 
-    # Field names in first column
-    keys = df_raw.iloc[:, 0].astype(str).str.strip()
+def is_vertical_isms(category, company):
+    return (category or "").upper() == "ISMS" and (company or "").upper() == "CSPL"
 
-    # Values: all remaining columns, transpose if needed
-    values = df_raw.iloc[:, 1:]
 
-    # If multiple columns, each column represents a record
-    records = []
-    for col_idx in range(values.shape[1]):
-        record_values = values.iloc[:, col_idx].tolist()
-        record = dict(zip(keys, record_values))
-        records.append(record)
+def load_workbook(user_file):
+    """Parsed sheets of an uploaded file, served from the process-wide cache"""
+    return workbook_cache.get(
+        user_file.id,
+        user_file.file_path,
+        vertical=is_vertical_isms(user_file.category, user_file.company)
+    )
 
-    df = pd.DataFrame(records)
-    # Clean column names
-    df.columns = [c.strip().replace(" ", "_") for c in df.columns]
 
-    return df
+def lookup_workbook(user_file):
+    """
+    Workbook for fetching a row or two: the cached or stored (sidecar) parse
+    when there is one, otherwise a StreamedWorkbook for large files,
+    otherwise a fresh parse.
+    """
+    vertical = is_vertical_isms(user_file.category, user_file.company)
+    path = user_file.file_path
+    cached = workbook_cache.peek(user_file.id, path, vertical=vertical)
+    if cached is not None:
+        return cached
+
+    stored = read_sidecar(path, vertical=vertical)
+    if stored is not None:
+        workbook_cache.put(user_file.id, path, stored, vertical=vertical)
+        return stored
+
+    if not vertical and can_stream(path) and os.path.getsize(path) >= STREAM_LOOKUP_MIN_BYTES:
+        return StreamedWorkbook(path)
+    return load_workbook(user_file)
 
 
 @app.route('/')
@@ -140,9 +258,34 @@ def register():
 
     db.session.add(new_user)
     db.session.commit()
+    user_states.invalidate(new_user.id)
 
     return {"message": f"User '{username}' created with role '{role}'"}, 201
 
+# Password hashing runs on a few dedicated threads (bcrypt releases the GIL),
+# so a burst of logins is worked through LOGIN_HASH_WORKERS at a time instead
+# of every request thread fighting for the CPU. Past LOGIN_HASH_QUEUE waiting
+# logins, new ones are turned away with 503 rather than piling up.
+LOGIN_HASH_WORKERS = int(os.getenv("LOGIN_HASH_WORKERS", str(os.cpu_count() or 2)))
+LOGIN_HASH_QUEUE = int(os.getenv("LOGIN_HASH_QUEUE", "64"))
+
+password_pool = ThreadPoolExecutor(max_workers=LOGIN_HASH_WORKERS, thread_name_prefix="password")
+password_slots = threading.BoundedSemaphore(LOGIN_HASH_WORKERS + LOGIN_HASH_QUEUE)
+
+
+class PasswordPoolBusy(Exception):
+    pass
+
+
+def run_password_work(fn, *args):
+    """Runs ``fn(*args)`` on the password pool and waits for it"""
+    if not password_slots.acquire(blocking=False):
+        raise PasswordPoolBusy()
+    future = password_pool.submit(fn, *args)
+    future.add_done_callback(lambda _: password_slots.release())
+    return future.result()
+
+
 @app.route("/login", methods=["POST"])
 def login():
     data = request.json
@@ -150,17 +293,32 @@ def login():
     password = data.get("password")
 
     user = User.query.filter_by(username=username).first()
-    if not user or not user.check_password(password):
-        return {"error": "Invalid username or password"}, 401
-
-    access_token = create_access_token(identity=str(user.id))
+    try:
+        if not user or not run_password_work(user.check_password, password):
+            return {"error": "Invalid username or password"}, 401
+    except PasswordPoolBusy:
+        return {"error": "Too many logins in progress, please retry"}, 503, {"Retry-After": "2"}
+
+    rounds = app.config["BCRYPT_LOG_ROUNDS"]
+    if user.needs_rehash(rounds):
+        # The password is already checked: a busy pool only postpones the
+        # rehash to a later login, it never turns this one away
+        try:
+            user.password = run_password_work(User.hash_password, password)
+            db.session.commit()
+            print(f"🔐 Rehashed password of {user.username} at cost {rounds}")
+        except PasswordPoolBusy:
+            pass
+
+    access_token = create_access_token(identity=str(user.id), additional_claims=token_claims(user))
     return jsonify(access_token=access_token, role=user.role)
 
 @app.route("/protected", methods=["GET"])
 @jwt_required()
 def protected():
-    current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
+    user = current_user_state()
+    if not user:
+        return {"error": "Please log in again"}, 401
     return {"message": f"Hello {user.username}, you are logged in!"}
 
 @app.route("/users", methods=["GET"])
@@ -393,6 +551,296 @@ CATEGORY_CHECKLIST_TEMPLATES = {
     }
 }
 
+
+def template_paths():
+    """Every template file the generators can use, remote sections included"""
+    paths = [p for company in CATEGORY_TEMPLATES.values() for mandays in company.values() for p in mandays.values()]
+    paths += [p for company in CATEGORY_CHECKLIST_TEMPLATES.values() for candidates in company.values() for p in candidates]
+    paths += [os.path.join(TEMPLATES_DIR, company, "remote_template.docx") for company in CATEGORY_TEMPLATES]
+    return paths
+
+
+template_registry = TemplateRegistry()
+template_registry.preload(template_paths())
+
+render_cache = RenderCache(
+    max_bytes=int(os.getenv("RENDER_CACHE_MAX_MB", "64")) * 1024 * 1024,
+    max_entries=int(os.getenv("RENDER_CACHE_MAX_ENTRIES", "256")),
+)
+
+# TEMPLATE_WARMUP=1 also pre-parses every template in the background; otherwise
+# each template is parsed on its first render
+if os.getenv("TEMPLATE_WARMUP", "0") == "1" and multiprocessing.parent_process() is None:
+    threading.Thread(
+        target=template_registry.preload,
+        args=(template_paths(),),
+        kwargs={"warm": True},
+        name="template-warmup",
+        daemon=True
+    ).start()
+
+
+class GenerationError(Exception):
+    """A generation request that cannot be served, with the HTTP status to report"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def docx_template_for(company, category, manday_key):
+    if company not in CATEGORY_TEMPLATES:
+        raise GenerationError(f"Invalid company: {company}")
+
+    if category not in CATEGORY_TEMPLATES[company]:
+        raise GenerationError(f"No templates for {company} - {category}")
+
+    template_file = CATEGORY_TEMPLATES[company][category].get(manday_key)
+    if not template_file or not os.path.exists(template_file):
+        raise GenerationError(f"No template for {company} - {category} - {manday_key}")
+
+    return template_file
+
+
+def remote_template_for(company):
+    remote_template_path = os.path.join(TEMPLATES_DIR, company, "remote_template.docx")
+    if not os.path.exists(remote_template_path):
+        print(f"⚠️ Remote template not found: {remote_template_path}")
+        return None
+    return remote_template_path
+
+
+def render_document(template_path, context, remote_template_path=None, certificate=True):
+    """
+    DOCX bytes for ``context`` rendered into a template, served from
+    render_cache when the same template (and remote section) already
+    rendered identical data. ``certificate`` selects render_docx (with its
+    remote section) over a plain render_template.
+    """
+    template = template_registry.entry(template_path)
+    remote = template_registry.entry(remote_template_path) if remote_template_path else None
+
+    key = render_key(
+        "certificate" if certificate else "plain",
+        template.digest,
+        remote.digest if remote else None,
+        context
+    )
+    with phase("render") as timing:
+        data = render_cache.get(key)
+        if data is None:
+            if certificate:
+                data = render_docx(
+                    template_registry.get(template_path),
+                    context,
+                    remote_template=template_registry.stream(remote_template_path) if remote else None
+                )
+            else:
+                data = render_template(template_registry.get(template_path), context)
+
+            render_cache.put(key, data)
+        timing.nbytes = len(data)
+    return data
+
+
+def document_bytes(doc):
+    """DOCX bytes of a GeneratedDoc / ChecklistDoc, wherever they are stored"""
+    if doc.blob_hash:
+        return blob_store.get(doc.blob_hash)
+    return doc.file_data
+
+
+def generated_file_bytes(user_file):
+    """DOCX bytes behind a "generated" UserFile row, or None if they are gone"""
+    if user_file.blob_hash:
+        return blob_store.get(user_file.blob_hash)
+
+    # Rows recorded before user_files.blob_hash: the newest document of that name
+    for model in (GeneratedDoc, ChecklistDoc):
+        doc = model.query.filter_by(
+            user_id=user_file.user_id,
+            file_name=user_file.file_name,
+            category=user_file.category,
+            company=user_file.company,
+        ).order_by(model.created_at.desc()).first()
+        if doc:
+            return document_bytes(doc)
+    return None
+
+
+def document_listing(model):
+    """
+    Query for document listings: metadata columns only, so neither the
+    inline file_data nor anything else large is fetched per row.
+    """
+    return model.query.options(
+        db.load_only(
+            model.id, model.row_id, model.file_name, model.category,
+            model.company, model.created_at, model.user_id
+        )
+    )
+
+
+def generated_row_ids_query(user_id, category, company):
+    def distinct_rows(model, source):
+        return db.select(db.literal(source).label("source"), model.row_id).where(
+            model.user_id == user_id,
+            model.category == category,
+            model.company == company
+        ).distinct()
+
+    return db.union_all(distinct_rows(GeneratedDoc, "doc"), distinct_rows(ChecklistDoc, "checklist"))
+
+
+def generated_row_ids(user_id, category, company):
+    """
+    Row ids that already have a certificate / a checklist, as two sets.
+    One round trip that returns only distinct ids, however many times a
+    row has been regenerated.
+    """
+    generated, checklists = set(), set()
+    for source, row_id in db.session.execute(generated_row_ids_query(user_id, category, company)):
+        (generated if source == "doc" else checklists).add(row_id)
+    return generated, checklists
+
+
+def uploaded_file_for(user_id, file_id, **filters):
+    user_file = UserFile.query.filter_by(
+        id=file_id,
+        user_id=user_id,
+        source_type="uploaded",
+        **filters
+    ).first()
+
+    if not user_file:
+        raise GenerationError("File not found or access denied", 404)
+
+    return user_file
+
+
+def wants_async():
+    return request.args.get("async", "").lower() in ["1", "true", "yes"]
+
+
+def job_accepted(job):
+    return jsonify({"job_id": job.id, "status_url": f"/jobs/{job.id}"}), 202
+
+
+def master_rows(user_file):
+    """First sheet of an upload with the 1-based "id" column the dashboard uses"""
+    ext = user_file.file_path.lower().split(".")[-1]
+    if ext not in ["xlsm", "xlsx", "xls", "csv"]:
+        raise GenerationError(f"Unsupported file type: {ext}")
+
+    df = load_workbook(user_file).first_sheet().reset_index()
+    df.rename(columns={"index": "id"}, inplace=True)
+    df["id"] = df["id"] + 1
+    return df
+
+
+def checklist_certificates(df_checklist, category):
+    """Normalized certificate numbers that have a row on the checklist sheet"""
+    if df_checklist is None:
+        return set()
+
+    # For IMS, map Certificate_No_QMS
+    if category == "IMS" and "Certificate_No_QMS" in df_checklist.columns:
+        column = df_checklist["Certificate_No_QMS"]
+    else:
+        column = df_checklist["Certificate_No"]
+    return set(column.astype(str).str.strip().str.upper())
+
+
+def annotate_rows(df_master, category, checklist_certs, generated_rows, generated_checklists):
+    """
+    Master sheet as the dashboards show it: a 1-based "id", the normalized
+    Certificate_No and the ChecklistAvailable / Status / ChecklistGenerated
+    flags. Every step is a column operation, so this stays cheap on large sheets.
+    """
+    df = df_master.reset_index().rename(columns={"index": "id"})
+    df["id"] = df["id"] + 1
+
+    if category == "IMS":
+        cert_col = "Certificate_No_QMS" if "Certificate_No_QMS" in df.columns else None
+    else:
+        cert_col = "Certificate_No" if "Certificate_No" in df.columns else None
+
+    if cert_col:
+        df["Certificate_No"] = df[cert_col].astype(str).str.strip().str.upper()
+    else:
+        df["Certificate_No"] = None
+
+    df["ChecklistAvailable"] = df["Certificate_No"].isin(checklist_certs)
+    df["Status"] = np.where(df["id"].isin(generated_rows), "Generated", "Pending")
+    df["ChecklistGenerated"] = df["id"].isin(generated_checklists)
+    return df
+
+
+HTTP_DATE_FORMAT = "%a, %d %b %Y %H:%M:%S GMT"
+
+
+def rows_records(df):
+    """
+    ``df``'s rows as dicts for jsonify, with NaN and inf as None.
+
+    Built a column at a time: dates are formatted the way jsonify would
+    (http_date) up front instead of once per value in the encoder.
+    """
+    columns = []
+    for name in df.columns:
+        values = df[name]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            present = values.notna()
+            values = values.dt.strftime(HTTP_DATE_FORMAT).astype(object).where(present, None)
+        elif pd.api.types.is_float_dtype(values):
+            values = values.astype(object).where(np.isfinite(values), None)
+        elif values.hasnans:
+            values = values.astype(object).where(values.notna(), None)
+        columns.append(values.tolist())
+
+    names = [str(name) for name in df.columns]
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def store_document(model, user_id, row_id, file_name, data, category, company):
+    """
+    Stores a rendered GeneratedDoc / ChecklistDoc and records it in the database.
+    Returns the new record and the same bytes, ready to send back.
+    """
+    with phase("store", len(data)):
+        output_path = None
+        if KEEP_GENERATED_ON_DISK:
+            output_path = os.path.join(OUTPUT_DIR, file_name)
+            with open(output_path, "wb") as f:
+                f.write(data)
+
+        blob_hash, blob_size = blob_store.put(data)
+
+        record = model(
+            row_id=row_id,
+            file_name=file_name,
+            blob_hash=blob_hash,
+            blob_size=blob_size,
+            user_id=user_id,
+            category=category,
+            company=company
+        )
+        db.session.add(record)
+
+        db.session.add(UserFile(
+            user_id=user_id,
+            file_name=file_name,
+            file_path=output_path,
+            blob_hash=blob_hash,
+            source_type="generated",
+            category=category,
+            company=company
+        ))
+
+        db.session.commit()
+    return record, data
+
+
 def make_browser_safe_filename(org_name, category):
     org_name = org_name.strip()
     org_name_safe = re.sub(r'[^\w]', '_', org_name)
@@ -404,142 +852,349 @@ def make_browser_safe_filename(org_name, category):
     return full_name
 
 
+def generate_docx_document(user_id, file_id, row_id, company=None, manday_key=None, mode="normal"):
+    """Renders and stores the certificate for one master row"""
+    user_file = uploaded_file_for(user_id, file_id)
+
+    category = user_file.category
+    company = (company or user_file.company).upper()
+
+    template_file = docx_template_for(company, category, manday_key)
+
+    ext = user_file.file_path.lower().split(".")[-1]
+    if ext not in ["xlsm", "xlsx", "xls", "csv"]:
+        raise GenerationError(f"Unsupported file type: {ext}")
+
+    with phase("parse"):
+        workbook = lookup_workbook(user_file)
+        row = workbook.row(workbook.sheet_names[0], row_id)
+    if row is None:
+        raise GenerationError("Row not found", 404)
+
+    row_data = docx_context(row)
+
+    data = render_document(
+        template_file,
+        row_data,
+        remote_template_path=remote_template_for(company) if mode == "remote" else None
+    )
+
+    file_name_safe = docx_file_name(row_data, category, f"record_{file_id}_{row_id}")
+    return store_document(
+        GeneratedDoc, user_id, row_id, file_name_safe, data, category, company
+    )
+
+
+@job_handler("docx")
+def run_docx_job(job, params):
+    doc, _ = generate_docx_document(job.user_id, **params)
+    report_progress(job, {"row_id": doc.row_id, "file_name": doc.file_name, "source": "GeneratedDoc", "doc_id": doc.id})
+
+
 @app.route("/generate-docx/<int:file_id>/<int:row_id>", methods=["GET"])
 @jwt_required()
+@traced("generate_docx")
 def generate_docx(file_id, row_id):
     try:
         current_user_id = int(get_jwt_identity())
 
-        user_file = UserFile.query.filter_by(
-            id=file_id,
-            user_id=current_user_id,
-            source_type="uploaded"
-        ).first()
+        params = {
+            "file_id": file_id,
+            "row_id": row_id,
+            "company": request.args.get("company"),
+            "manday_key": request.args.get("template_type"),
+            "mode": request.args.get("mode", "normal"),
+        }
 
-        if not user_file:
-            return jsonify({"error": "File not found or access denied"}), 404
+        if wants_async():
+            uploaded_file_for(current_user_id, file_id)
+            return job_accepted(enqueue_job(current_user_id, "docx", params))
 
-        category = user_file.category
-        company = request.args.get("company", user_file.company).upper()
-        manday_key = request.args.get("template_type")
-        mode = request.args.get("mode", "normal")
+        doc, data = generate_docx_document(current_user_id, **params)
 
-        if company not in CATEGORY_TEMPLATES:
-            return jsonify({"error": f"Invalid company: {company}"}), 400
+        return send_file(
+            io.BytesIO(data),
+            as_attachment=True,
+            download_name=doc.file_name,
+            mimetype=DOCX_MIMETYPE
+        )
 
-        if category not in CATEGORY_TEMPLATES[company]:
-            return jsonify({"error": f"No templates for {company} - {category}"}), 400
+    except GenerationError as e:
+        return jsonify({"error": str(e)}), e.status_code
 
-        template_file = CATEGORY_TEMPLATES[company][category].get(manday_key)
-        if not template_file or not os.path.exists(template_file):
-            return jsonify({"error": f"No template for {company} - {category} - {manday_key}"}), 400
+    except Exception as e:
+        db.session.rollback()
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
 
-        ext = user_file.file_path.lower().split(".")[-1]
-        if ext in ["xlsm", "xlsx"]:
-            df = pd.read_excel(user_file.file_path, engine="openpyxl")
-        elif ext == "xls":
-            df = pd.read_excel(user_file.file_path, engine="xlrd")
-        elif ext == "csv":
-            try:
-                df = pd.read_csv(user_file.file_path, encoding="utf-8")
-            except:
-                df = pd.read_csv(user_file.file_path, encoding="latin1")
-        else:
-            return jsonify({"error": f"Unsupported file type: {ext}"}), 400
 
-        df.columns = [c.strip().replace(" ", "_").replace("/", "_") for c in df.columns]
-        df.reset_index(inplace=True)
-        df.rename(columns={"index": "id"}, inplace=True)
-        df["id"] = df["id"] + 1
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", str(os.cpu_count() or 2)))
+BULK_START_METHOD = os.getenv("BULK_START_METHOD", "spawn")
+
+# One pool per process, started by the first bulk job and shared by all later
+# ones: spawned children import the rendering code (and, under "python
+# app.py", this module) once, not once per job
+_bulk_pool = None
+_bulk_pool_lock = threading.Lock()
 
-        row = df[df["id"] == row_id].to_dict(orient="records")
-        if not row:
-            return jsonify({"error": "Row not found"}), 404
 
-        row_data = row[0]
+def bulk_pool():
+    global _bulk_pool
+    with _bulk_pool_lock:
+        if _bulk_pool is None:
+            _bulk_pool = ProcessPoolExecutor(
+                max_workers=max(1, BULK_WORKERS),
+                mp_context=multiprocessing.get_context(BULK_START_METHOD),
+                initializer=init_bulk_worker
+            )
+        return _bulk_pool
 
-        for k, v in row_data.items():
 
-            if isinstance(v, (pd.Timestamp, datetime)):
-                row_data[k] = v.strftime("%d-%m-%Y")
+def discard_bulk_pool(pool):
+    """Drops a pool whose worker died, so the next bulk job starts a new one"""
+    global _bulk_pool
+    with _bulk_pool_lock:
+        if _bulk_pool is pool:
+            _bulk_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
 
-            elif isinstance(v, str):
-                row_data[k] = (
-                    v.replace("&", "&amp;")
-                    .replace("<", "&lt;")
-                    .replace(">", "&gt;")
-                )
 
-            elif pd.isna(v):
-                row_data[k] = ""
+@job_handler("bulk_docx")
+def run_bulk_docx_job(job, params):
+    """Renders the job's rows in a process pool and stores each result as it arrives"""
+    user_file = uploaded_file_for(job.user_id, params["file_id"])
+
+    category = user_file.category
+    company = (params.get("company") or user_file.company).upper()
+    mode = params.get("mode", "normal")
+
+    template_file = docx_template_for(company, category, params.get("manday_key"))
+    remote_template = remote_template_for(company) if mode == "remote" else None
 
-        # doc = DocxTemplate(template_file)
-        # doc.render(row_data)
+    # A job taken over from a dead worker only renders the rows it has not stored yet
+    done = finished_row_ids(job)
+    row_ids = [r for r in params["row_ids"] if r not in done]
 
-        doc = DocxTemplate(template_file)
+    rows = master_rows(user_file)
+    records = rows[rows["id"].isin(row_ids)].to_dict(orient="records")
+    job_rows = {int(r["id"]): r for r in records}
 
-        # 🔹 Handle remote section
-        if mode == "remote":
-            remote_template_path = os.path.join(
-                "templates", company, "remote_template.docx"
+    for row_id in row_ids:
+        if row_id not in job_rows:
+            report_progress(job, {"row_id": row_id, "error": "Row not found"})
+
+    if not job_rows:
+        return
+
+    pool = bulk_pool()
+    futures = {
+        pool.submit(render_bulk_row, template_file, remote_template, category, user_file.id, row_id, row): row_id
+        for row_id, row in job_rows.items()
+    }
+
+    for future in as_completed(futures):
+        row_id = futures[future]
+        try:
+            file_name, data = future.result()
+            doc, _ = store_document(
+                GeneratedDoc, job.user_id, row_id, file_name, data, category, company
             )
+            result = {"row_id": row_id, "file_name": file_name, "source": "GeneratedDoc", "doc_id": doc.id}
+        except BrokenProcessPool as e:
+            discard_bulk_pool(pool)
+            result = {"row_id": row_id, "error": f"Render worker died: {e}"}
+        except Exception as e:
+            db.session.rollback()
+            result = {"row_id": row_id, "error": str(e)}
 
-            if os.path.exists(remote_template_path):
-                subdoc = doc.new_subdoc(remote_template_path)
-                row_data["remote_section"] = subdoc
-            else:
-                print(f"⚠️ Remote template not found: {remote_template_path}")
-                row_data["remote_section"] = ""
+        report_progress(job, result)
+
+
+def int_list(value):
+    """``value`` as a list of ints, or None when it is not a list of numbers"""
+    if not isinstance(value, list):
+        return None
+    try:
+        return [int(v) for v in value]
+    except (TypeError, ValueError):
+        return None
+
+
+@app.route("/generate-docx-bulk/<int:file_id>", methods=["POST"])
+@jwt_required()
+def generate_docx_bulk(file_id):
+    """
+    Queues the certificates for many rows of one upload.
+
+    Body: template_type, optional company / mode, and exactly one of
+    row_ids (list), row_range ([first, last], inclusive) or pending (true).
+    Poll /jobs/<job_id> for progress.
+    """
+    try:
+        current_user_id = int(get_jwt_identity())
+        data = request.json or {}
+
+        user_file = uploaded_file_for(current_user_id, file_id)
+
+        category = user_file.category
+        company = (data.get("company") or user_file.company).upper()
+        manday_key = data.get("template_type")
+
+        docx_template_for(company, category, manday_key)
+
+        all_ids = master_rows(user_file)["id"].tolist()
+
+        selectors = [k for k in ("row_ids", "row_range", "pending") if data.get(k)]
+        if len(selectors) != 1:
+            return jsonify({"error": "Pass exactly one of row_ids, row_range or pending"}), 400
+
+        if "row_ids" in selectors:
+            wanted = int_list(data["row_ids"])
+            if wanted is None:
+                return jsonify({"error": "row_ids must be a list of integers"}), 400
+            wanted = set(wanted)
+            row_ids = [r for r in all_ids if r in wanted]
+        elif "row_range" in selectors:
+            bounds = int_list(data["row_range"])
+            if bounds is None or len(bounds) != 2:
+                return jsonify({"error": "row_range must be [first, last]"}), 400
+            first, last = bounds
+            row_ids = [r for r in all_ids if first <= r <= last]
         else:
-            row_data["remote_section"] = ""
-
-        # Render AFTER setting variable
-        doc.render(row_data)
-
-        org_name = row_data.get("Organization_Name", f"record_{file_id}_{row_id}")
-        org_name_safe = re.sub(r'[^\w]', '_', org_name).strip("_")
-        file_name_safe = f"{org_name_safe}-{category.lower()}.docx"
-        output_path = os.path.join(OUTPUT_DIR, file_name_safe)
-
-        doc.save(output_path)
-
-        with open(output_path, "rb") as f:
-            new_doc = GeneratedDoc(
-                row_id=row_id,
-                file_name=file_name_safe,
-                file_data=f.read(),
-                user_id=current_user_id,
-                category=category,
-                company=company 
-            )
-        db.session.add(new_doc)
+            generated, _ = generated_row_ids(current_user_id, category, company)
+            row_ids = [r for r in all_ids if r not in generated]
 
-        generated_file = UserFile(
-            user_id=current_user_id,
-            file_name=file_name_safe,
-            file_path=output_path,
-            source_type="generated",
-            category=category,
-            company=company
-        )
-        db.session.add(generated_file)
+        if not row_ids:
+            return jsonify({"error": "No matching rows"}), 400
 
-        db.session.commit()
+        job = enqueue_job(current_user_id, "bulk_docx", {
+            "file_id": file_id,
+            "row_ids": [int(r) for r in row_ids],
+            "company": company,
+            "manday_key": manday_key,
+            "mode": data.get("mode", "normal"),
+        }, total=len(row_ids))
 
-        return send_file(
-            output_path,
-            as_attachment=True,
-            download_name=file_name_safe,
-            mimetype="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        )
+        return jsonify({"job_id": job.id, "status_url": f"/jobs/{job.id}", "total": len(row_ids)}), 202
+
+    except GenerationError as e:
+        return jsonify({"error": str(e)}), e.status_code
 
     except Exception as e:
         db.session.rollback()
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
-    
+
+
+@app.route("/jobs", methods=["GET"])
+@jwt_required()
+def list_jobs():
+    current_user_id = int(get_jwt_identity())
+    jobs = GenerationJob.query.filter_by(user_id=current_user_id) \
+        .order_by(GenerationJob.created_at.desc()).limit(50).all()
+    return jsonify([job_to_dict(j) for j in jobs])
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+@jwt_required()
+def get_job(job_id):
+    current_user_id = int(get_jwt_identity())
+    job = GenerationJob.query.filter_by(id=job_id, user_id=current_user_id).first()
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify(job_to_dict(job))
+
+
+@app.route("/jobs/<job_id>/download", methods=["GET"])
+@jwt_required()
+def download_job_result(job_id):
+    current_user_id = int(get_jwt_identity())
+    job = GenerationJob.query.filter_by(id=job_id, user_id=current_user_id).first()
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    if job.status != "finished":
+        return jsonify({"error": f"Job is {job.status}", "job": job_to_dict(job)}), 409
+
+    results = [r for r in job_to_dict(job)["results"] if "doc_id" in r]
+    if not results:
+        return jsonify({"error": "Job produced no documents", "job": job_to_dict(job)}), 404
+
+    if len(results) > 1:
+        docs = []
+        for r in results:
+            model = ChecklistDoc if r["source"] == "ChecklistDoc" else GeneratedDoc
+            docs.append((model, r["doc_id"], r["file_name"], job.finished_at))
+        return zip_response(docs, f"job_{job.id}.zip")
+
+    model = ChecklistDoc if results[0]["source"] == "ChecklistDoc" else GeneratedDoc
+    doc = model.query.filter_by(id=results[0]["doc_id"], user_id=current_user_id).first()
+    if not doc:
+        return jsonify({"error": "File not found or access denied"}), 404
+
+    response = send_file(
+        io.BytesIO(document_bytes(doc)),
+        as_attachment=True,
+        download_name=doc.file_name,
+        mimetype=DOCX_MIMETYPE
+    )
+    response.headers["Access-Control-Expose-Headers"] = "Content-Disposition"
+    return response
+
+def generate_isms_document(user_id, file_id, col_id):
+    """Renders and stores the ISMS certificate for one column of a vertical sheet"""
+    # Fetch uploaded ISMS Excel
+    user_file = UserFile.query.filter_by(
+        id=file_id,
+        user_id=user_id,
+        category="ISMS",
+        company="CSPL",
+        source_type="uploaded"
+    ).first()
+
+    if not user_file or not os.path.exists(user_file.file_path):
+        raise GenerationError("ISMS file not found or missing", 404)
+
+    # Load ISMS template
+    isms_templates = CATEGORY_TEMPLATES.get("CSPL", {}).get("ISMS", {})
+    if not isms_templates:
+        raise GenerationError("No ISMS templates configured")
+
+    template_path = list(isms_templates.values())[0]
+    if not os.path.exists(template_path):
+        raise GenerationError("ISMS template file missing")
+
+    # Read Excel (vertical format)
+    with phase("parse"):
+        df_raw = load_workbook(user_file).raw
+
+    if df_raw.empty or df_raw.shape[1] < 2:
+        raise GenerationError("Excel contains no data")
+
+    if col_id <= 0 or col_id >= df_raw.shape[1]:
+        raise GenerationError("Invalid col_id")
+
+    # Column A = field names, Column col_id = values
+    field_names = df_raw.iloc[:, 0].astype(str).str.strip()
+    clean_data = isms_context(field_names, df_raw.iloc[:, col_id])
+
+    data = render_document(template_path, clean_data, certificate=False)
+
+    return store_document(
+        GeneratedDoc, user_id, col_id, isms_file_name(clean_data, col_id), data, "ISMS", "CSPL"
+    )
+
+
+@job_handler("isms")
+def run_isms_job(job, params):
+    doc, _ = generate_isms_document(job.user_id, **params)
+    report_progress(job, {"row_id": doc.row_id, "file_name": doc.file_name, "source": "GeneratedDoc", "doc_id": doc.id})
+
+
 @app.route("/generate-docx-isms/<int:file_id>", methods=["GET"])
 @jwt_required()
+@traced("generate_docx_isms")
 def generate_docx_isms(file_id):
     """
     Generates DOCX from vertical ISMS Excel.
@@ -548,100 +1203,28 @@ def generate_docx_isms(file_id):
     try:
         current_user_id = int(get_jwt_identity())
 
-        # Fetch uploaded ISMS Excel
-        user_file = UserFile.query.filter_by(
-            id=file_id,
-            user_id=current_user_id,
-            category="ISMS",
-            company="CSPL",
-            source_type="uploaded"
-        ).first()
-
-        if not user_file or not os.path.exists(user_file.file_path):
-            return jsonify({"error": "ISMS file not found or missing"}), 404
-
-        # Load ISMS template
-        isms_templates = CATEGORY_TEMPLATES.get("CSPL", {}).get("ISMS", {})
-        if not isms_templates:
-            return jsonify({"error": "No ISMS templates configured"}), 400
-
-        template_path = list(isms_templates.values())[0]
-        if not os.path.exists(template_path):
-            return jsonify({"error": "ISMS template file missing"}), 400
-
-        # Read Excel (vertical format)
-        ext = user_file.file_path.lower().split(".")[-1]
-        engine = "openpyxl" if ext in ["xlsx", "xlsm"] else None
-        df_raw = pd.read_excel(user_file.file_path, engine=engine, header=None, keep_default_na=False)
-
-        if df_raw.empty or df_raw.shape[1] < 2:
-            return jsonify({"error": "Excel contains no data"}), 400
-
         # Determine column to generate
         col_id = int(request.args.get("col_id", 1))  # Column B = 1
-        if col_id <= 0 or col_id >= df_raw.shape[1]:
-            return jsonify({"error": "Invalid col_id"}), 400
-
-        # Column A = field names, Column col_id = values
-        field_names = df_raw.iloc[:, 0].astype(str).str.strip()
-        values = df_raw.iloc[:, col_id]
-
-        # Build dictionary for DOCX
-        clean_data = {}
-        for key, val in zip(field_names, values):
-            key_safe = re.sub(r"[^\w]", "_", key)
-            if isinstance(val, (pd.Timestamp, datetime)):
-                clean_data[key_safe] = val.strftime("%d-%m-%Y")
-            elif pd.isna(val):
-                clean_data[key_safe] = ""
-            else:
-                clean_data[key_safe] = str(val)
-
-        # Render DOCX
-        doc = DocxTemplate(template_path)
-        doc.render(clean_data)
-
-        # Save output
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
-        org_name = clean_data.get("Organization_Name", f"ISMS_Record_{col_id}")
-        safe_org = re.sub(r"[^\w]", "_", org_name)
-        output_name = f"{safe_org}.docx"
-        output_path = os.path.join(OUTPUT_DIR, output_name)
-        doc.save(output_path)
-
-        # Store in DB
-        with open(output_path, "rb") as f:
-            gen_doc = GeneratedDoc(
-                row_id=col_id,
-                file_name=output_name,
-                file_data=f.read(),
-                user_id=current_user_id,
-                category="ISMS",
-                company="CSPL"
-            )
-            db.session.add(gen_doc)
 
-        db.session.add(UserFile(
-            user_id=current_user_id,
-            file_name=output_name,
-            file_path=output_path,
-            source_type="generated",
-            category="ISMS",
-            company="CSPL"
-        ))
+        if wants_async():
+            uploaded_file_for(current_user_id, file_id, category="ISMS", company="CSPL")
+            return job_accepted(enqueue_job(current_user_id, "isms", {"file_id": file_id, "col_id": col_id}))
 
-        db.session.commit()
+        doc, data = generate_isms_document(current_user_id, file_id, col_id)
 
         # Send file
         response = send_file(
-            output_path,
+            io.BytesIO(data),
             as_attachment=True,
-            download_name=output_name,
-            mimetype="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+            download_name=doc.file_name,
+            mimetype=DOCX_MIMETYPE
         )
         response.headers["Access-Control-Expose-Headers"] = "Content-Disposition"
         return response
 
+    except GenerationError as e:
+        return jsonify({"error": str(e)}), e.status_code
+
     except Exception as e:
         db.session.rollback()
         traceback.print_exc()
@@ -716,8 +1299,175 @@ def generate_docx_isms(file_id):
 #         return {"error": str(e)}, 500
 
 
+@job_handler("index")
+def run_index_job(job, params):
+    """Parses a new upload: writes its sidecar and warms this process's workbook cache"""
+    user_file = UserFile.query.filter_by(id=params["file_id"], user_id=job.user_id).first()
+    if not user_file:
+        raise GenerationError("File not found or access denied", 404)
+
+    workbook = load_workbook(user_file)
+    report_progress(job, {"file_id": user_file.id, "sheets": workbook.sheet_names})
+
+
+def upload_scope_error(category, company):
+    """Error response for an upload's (normalized) category and company, or None"""
+    if not category:
+        return {"error": "Category is required"}, 400
+
+    if company not in CATEGORY_TEMPLATES:
+        return {"error": f"Invalid company: {company}"}, 400
+
+    if category not in CATEGORY_TEMPLATES[company]:
+        return {"error": f"Invalid category for {company}: {category}"}, 400
+
+    return None
+
+
+def upload_format_error(file_name, category, company):
+    """Error response for a file type the category cannot take, or None"""
+    ext = file_name.lower().split(".")[-1]
+
+    if ext == "csv" and is_vertical_isms(category, company):
+        return {"error": "ISMS vertical format supports Excel only"}, 400
+
+    if ext not in ["xls", "xlsx", "xlsm", "csv"]:
+        return {"error": f"Unsupported file format: {ext}"}, 400
+
+    return None
+
+
+def upload_dir_for(user_id):
+    user_dir = os.path.join("uploads", str(user_id))
+    os.makedirs(user_dir, exist_ok=True)
+    return user_dir
+
+
+def duplicate_upload_query(user_id, file_path, content_hash, category, company):
+    return UserFile.query.filter_by(
+        user_id=user_id,
+        source_type="uploaded",
+        content_hash=content_hash,
+        category=category,
+        company=company,
+        file_path=file_path
+    ).order_by(UserFile.id.desc())
+
+
+def register_upload(user_id, file_name, file_path, category, company, content_hash):
+    """
+    Validates a file stored under uploads/<user_id>/ by its content hash and
+    records it as a UserFile. Returns the response for the client (an error
+    tuple when the file does not fit its category).
+    """
+    # The same bytes uploaded again for the same category: the file, its
+    # sidecar and its cache entry are all still good, so reuse the record
+    existing = duplicate_upload_query(user_id, file_path, content_hash, category, company).first()
+
+    if existing:
+        existing.file_name = file_name
+        existing.uploaded_at = datetime.utcnow()
+        db.session.commit()
+        return {
+            "message": "File uploaded successfully",
+            "file_id": existing.id,
+            "deduplicated": True
+        }
+
+    # ----------------------------
+    # Detect vertical ISMS format
+    # ----------------------------
+    vertical = is_vertical_isms(category, company)
+
+    # ----------------------------
+    # Read file
+    # ----------------------------
+    error = upload_format_error(file_name, category, company)
+    if error:
+        return error
+
+    required_cols = CATEGORY_COLUMNS.get(category, [])
+
+    def missing_columns_error(columns):
+        missing = [col for col in required_cols if col not in columns]
+        if missing:
+            return {
+                "error": f"Uploaded file does not match expected format for {category}. "
+                         f"Missing columns: {missing}"
+            }, 400
+        return None
+
+    invalid_isms = {
+        "error": "Invalid ISMS format. Expected two columns (Field, Value)."
+    }, 400
+
+    # ----------------------------
+    # Validate structure
+    # ----------------------------
+    workbook = None
+
+    with phase("parse"):
+        if can_stream(file_path):
+            # Only the header row (vertical ISMS: the first two columns) is
+            # read here; the full parse runs afterwards as an "index" job
+            if vertical:
+                _, has_records = read_vertical_fields(file_path)
+                if not has_records:
+                    return invalid_isms
+            else:
+                error = missing_columns_error(read_header(file_path))
+                if error:
+                    return error
+        else:
+            # .xls has no streaming reader, so it is parsed and checked here
+            workbook = parse_workbook(file_path, vertical=vertical)
+
+            if vertical:
+                if workbook.raw.shape[1] < 2:
+                    return invalid_isms
+            else:
+                error = missing_columns_error(workbook.first_sheet().columns)
+                if error:
+                    return error
+
+            # Later reads load this instead of re-parsing the upload
+            write_sidecar(workbook, file_path)
+
+    # ----------------------------
+    # Save DB record
+    # ----------------------------
+    user_file = UserFile(
+        user_id=user_id,
+        file_name=file_name,
+        file_path=file_path,
+        source_type="uploaded",
+        category=category,
+        company=company,
+        content_hash=content_hash
+    )
+
+    with phase("store"):
+        db.session.add(user_file)
+        db.session.commit()
+
+    response = {
+        "message": "File uploaded successfully",
+        "file_id": user_file.id
+    }
+
+    if workbook is not None:
+        workbook_cache.put(user_file.id, file_path, workbook, vertical=vertical)
+    else:
+        # Reads before the job has run simply parse the file themselves
+        job = enqueue_job(user_id, "index", {"file_id": user_file.id})
+        response["index_job_id"] = job.id
+
+    return response
+
+
 @app.route("/upload-file", methods=["POST"])
 @jwt_required()
+@traced("upload_file")
 def upload_file():
     try:
         current_user_id = int(get_jwt_identity())
@@ -732,101 +1482,235 @@ def upload_file():
         if file.filename == "":
             return {"error": "No file selected"}, 400
 
-        category = request.form.get("category")
-        company = request.form.get("company", "").upper()
-
-        if not category:
-            return {"error": "Category is required"}, 400
+        category = normalize_code(request.form.get("category", ""))
+        company = normalize_code(request.form.get("company", ""))
 
-        if company not in CATEGORY_TEMPLATES:
-            return {"error": f"Invalid company: {company}"}, 400
-
-        # ----------------------------
-        # Detect vertical ISMS format
-        # ----------------------------
-        is_vertical_isms = (category.upper() == "ISMS" and company == "CSPL")
+        error = upload_scope_error(category, company)
+        if error:
+            return error
 
         # ----------------------------
         # Save uploaded file
         # ----------------------------
-        user_dir = os.path.join("uploads", str(current_user_id))
-        os.makedirs(user_dir, exist_ok=True)
+        user_dir = upload_dir_for(current_user_id)
+        part = part_path(user_dir, uuid.uuid4().hex)
+        with phase("receive") as timing:
+            digest = save_hashed(file.stream, part)
+            timing.nbytes = os.path.getsize(part)
 
-        file_path = os.path.join(user_dir, file.filename)
-        file.save(file_path)
+        file_path = content_path(user_dir, digest, file.filename)
+        with phase("store"):
+            store_part(part, file_path)
 
-        ext = file.filename.lower().split(".")[-1]
+        return register_upload(current_user_id, file.filename, file_path, category, company, digest)
 
-        # ----------------------------
-        # Read file
-        # ----------------------------
-        if ext in ["xls", "xlsx", "xlsm"]:
-            if is_vertical_isms:
-                # 🔴 Vertical ISMS → NO HEADER
-                df = pd.read_excel(file_path, engine="openpyxl", header=None)
-            else:
-                # 🟢 Normal horizontal
-                df = pd.read_excel(file_path, engine="openpyxl")
+    except Exception as e:
+        db.session.rollback()
+        traceback.print_exc()
+        return {"error": str(e)}, 500
 
-        elif ext == "csv":
-            if is_vertical_isms:
-                return {"error": "ISMS vertical format supports Excel only"}, 400
 
-            try:
-                df = pd.read_csv(file_path, encoding="utf-8")
-            except UnicodeDecodeError:
-                df = pd.read_csv(file_path, encoding="latin1")
+########################################## CHUNKED UPLOADS ###########################################
+#
+#   POST   /upload-sessions                      {file_name, category, company, size?} -> session
+#   PUT    /upload-sessions/<id>?offset=<n>      raw bytes of the next chunk           -> session
+#   GET    /upload-sessions/<id>                 where to resume                       -> session
+#   POST   /upload-sessions/<id>/finalize        {sha256}                              -> as /upload-file
+#   DELETE /upload-sessions/<id>                 abandon the upload
+#
+# "received" in a session is the offset of the next chunk. A PUT at any other
+# offset gets 409 with the current "received", so a client that lost track
+# after a dropped connection can pick up where the server actually is.
 
-        else:
-            return {"error": f"Unsupported file format: {ext}"}, 400
+UPLOAD_CHUNK_MAX_BYTES = int(float(os.getenv("UPLOAD_CHUNK_MAX_MB", "16")) * 1024 * 1024)
+UPLOAD_SESSION_MAX_AGE_HOURS = int(os.getenv("UPLOAD_SESSION_MAX_AGE_HOURS", "24"))
 
-        # ----------------------------
-        # Column normalization (ONLY for horizontal files)
-        # ----------------------------
-        if not is_vertical_isms:
-            df.columns = [
-                str(c).strip().replace(" ", "_").replace("/", "_")
-                for c in df.columns
-            ]
 
-        # ----------------------------
-        # Validate structure
-        # ----------------------------
-        if is_vertical_isms:
-            # Basic sanity check for vertical format
-            if df.shape[1] < 2:
-                return {
-                    "error": "Invalid ISMS format. Expected two columns (Field, Value)."
-                }, 400
-        else:
-            # Horizontal category validation
-            required_cols = CATEGORY_COLUMNS.get(category, [])
-            missing = [col for col in required_cols if col not in df.columns]
-            if missing:
-                return {
-                    "error": f"Uploaded file does not match expected format for {category}. "
-                             f"Missing columns: {missing}"
-                }, 400
+def upload_session_part(session):
+    return part_path(upload_dir_for(session.user_id), session.id)
 
-        # ----------------------------
-        # Save DB record
-        # ----------------------------
-        user_file = UserFile(
+
+def upload_session_to_dict(session):
+    return {
+        "upload_id": session.id,
+        "file_name": session.file_name,
+        "category": session.category,
+        "company": session.company,
+        "size": session.total_size,
+        "received": received_bytes(upload_session_part(session)),
+        "max_chunk_size": UPLOAD_CHUNK_MAX_BYTES,
+    }
+
+
+def upload_session_for(user_id, upload_id):
+    return UploadSession.query.filter_by(id=upload_id, user_id=user_id).first()
+
+
+def discard_upload_session(session):
+    path = upload_session_part(session)
+    if os.path.exists(path):
+        os.remove(path)
+    db.session.delete(session)
+    db.session.commit()
+
+
+@app.route("/upload-sessions", methods=["POST"])
+@jwt_required()
+def start_upload_session():
+    try:
+        current_user_id = int(get_jwt_identity())
+        data = request.get_json(silent=True) or {}
+
+        file_name = (data.get("file_name") or "").strip()
+        if not file_name or not secure_filename(file_name):
+            return {"error": "file_name is required"}, 400
+
+        category = normalize_code(data.get("category", ""))
+        company = normalize_code(data.get("company", ""))
+
+        # Refuse what finalize would refuse before any bytes are sent
+        error = upload_scope_error(category, company) or upload_format_error(file_name, category, company)
+        if error:
+            return error
+
+        total_size = data.get("size")
+        if total_size is not None and (not isinstance(total_size, int) or total_size < 0):
+            return {"error": "size must be a non-negative integer"}, 400
+
+        session = UploadSession(
+            id=uuid.uuid4().hex,
             user_id=current_user_id,
-            file_name=file.filename,
-            file_path=file_path,
-            source_type="uploaded",
+            file_name=file_name,
             category=category,
-            company=company
+            company=company,
+            total_size=total_size,
         )
+        db.session.add(session)
+        db.session.commit()
 
-        db.session.add(user_file)
+        # Created empty so "received" is 0 and the first PUT has a file to write into
+        open(upload_session_part(session), "wb").close()
+
+        return upload_session_to_dict(session), 201
+
+    except Exception as e:
+        db.session.rollback()
+        traceback.print_exc()
+        return {"error": str(e)}, 500
+
+
+@app.route("/upload-sessions/<upload_id>", methods=["GET"])
+@jwt_required()
+def get_upload_session(upload_id):
+    session = upload_session_for(int(get_jwt_identity()), upload_id)
+    if not session:
+        return {"error": "Upload not found"}, 404
+    return upload_session_to_dict(session)
+
+
+@app.route("/upload-sessions/<upload_id>", methods=["PUT"])
+@jwt_required()
+def append_upload_chunk(upload_id):
+    try:
+        session = upload_session_for(int(get_jwt_identity()), upload_id)
+        if not session:
+            return {"error": "Upload not found"}, 404
+
+        try:
+            offset = int(request.args.get("offset", ""))
+        except ValueError:
+            return {"error": "offset must be an integer"}, 400
+
+        path = upload_session_part(session)
+        received = received_bytes(path)
+        if offset != received:
+            return {"error": f"Expected offset {received}", "received": received}, 409
+
+        if request.content_length and request.content_length > UPLOAD_CHUNK_MAX_BYTES:
+            return {"error": f"Chunk exceeds {UPLOAD_CHUNK_MAX_BYTES} bytes"}, 413
+
+        limit = UPLOAD_CHUNK_MAX_BYTES
+        if session.total_size is not None:
+            limit = min(limit, session.total_size - offset)
+
+        try:
+            write_chunk(path, offset, request.stream, limit)
+        except ChunkTooLarge as e:
+            return {"error": str(e), "received": received_bytes(path)}, 413
+
+        session.updated_at = datetime.utcnow()
         db.session.commit()
 
-        return {
-            "message": "File uploaded successfully",
-            "file_id": user_file.id
-        }
+        return upload_session_to_dict(session)
+
+    except Exception as e:
+        db.session.rollback()
+        traceback.print_exc()
+        return {"error": str(e)}, 500
+
+
+@app.route("/upload-sessions/<upload_id>/finalize", methods=["POST"])
+@jwt_required()
+def finalize_upload_session(upload_id):
+    try:
+        current_user_id = int(get_jwt_identity())
+        session = upload_session_for(current_user_id, upload_id)
+        if not session:
+            return {"error": "Upload not found"}, 404
+
+        # The part file is created with the session: once it is gone, a
+        # finalize running alongside this one has taken it
+        already_finalized = {"error": "Upload already finalized"}, 409
+        path = upload_session_part(session)
+        if not os.path.exists(path):
+            return already_finalized
+
+        received = received_bytes(path)
+        if session.total_size is not None and received != session.total_size:
+            return {"error": f"Upload incomplete: {received} of {session.total_size} bytes", "received": received}, 409
+
+        expected = ((request.get_json(silent=True) or {}).get("sha256") or "").strip().lower()
+        if not expected:
+            return {"error": "sha256 is required"}, 400
+
+        try:
+            actual = file_sha256(path)
+            if actual != expected:
+                # The session is kept so the client can inspect it or DELETE and start over
+                return {"error": "Checksum mismatch", "sha256": actual, "received": received}, 422
+
+            # Validated in place at its content path; moved back if it is refused
+            file_path = content_path(upload_dir_for(current_user_id), actual, session.file_name)
+            moved = not os.path.exists(file_path)
+            if moved:
+                os.replace(path, file_path)
+        except FileNotFoundError:
+            return already_finalized
+
+        refused = True
+        try:
+            response = register_upload(
+                current_user_id, session.file_name, file_path, session.category, session.company, actual
+            )
+            refused = isinstance(response, tuple)
+        finally:
+            # Refused or unreadable (missing columns, a corrupt workbook): the
+            # bytes stay with the session
+            if refused and moved:
+                os.replace(file_path, path)
+        if refused:
+            return response
+
+        if not moved and os.path.exists(path):
+            os.remove(path)
+
+        # The session goes last; if it is already gone, another finalize got there first
+        if not UploadSession.query.filter_by(id=upload_id).delete():
+            db.session.rollback()
+            return already_finalized
+        db.session.commit()
+
+        return response
 
     except Exception as e:
         db.session.rollback()
@@ -834,6 +1718,17 @@ def upload_file():
         return {"error": str(e)}, 500
 
 
+@app.route("/upload-sessions/<upload_id>", methods=["DELETE"])
+@jwt_required()
+def abandon_upload_session(upload_id):
+    session = upload_session_for(int(get_jwt_identity()), upload_id)
+    if not session:
+        return {"error": "Upload not found"}, 404
+
+    discard_upload_session(session)
+    return {"message": "Upload discarded"}
+
+
 @app.route("/my-files", methods=["GET"])
 @jwt_required()
 def my_files():
@@ -942,6 +1837,7 @@ def my_files():
 
 @app.route("/excel-rows/<int:file_id>", methods=["GET"])
 @jwt_required()
+@traced("get_excel_rows")
 def get_excel_rows(file_id):
     try:
         current_user_id = int(get_jwt_identity())
@@ -950,133 +1846,42 @@ def get_excel_rows(file_id):
             return {"error": "File not found or access denied"}, 404
 
         ext = user_file.file_path.lower().split(".")[-1]
-
-        if ext in ["xlsm", "xlsx"]:
-            xl = pd.ExcelFile(user_file.file_path, engine="openpyxl")
-        elif ext == "xls":
-            xl = pd.ExcelFile(user_file.file_path, engine="xlrd")
-        elif ext == "csv":
-            df_master = pd.read_csv(user_file.file_path)
-        else:
+        if ext not in ["xlsm", "xlsx", "xls", "csv"]:
             return {"error": f"Unsupported file type: {ext}"}, 400
 
-        # --- Load master sheet ---
-        # category = user_file.category.upper()
-        # sheet_name_map = {
-        #     "QMS": "QMS 2025",
-        #     "EMS": "EMS 2025",
-        #     "OHSMS": "OHSMS 2025",
-        #     "IMS": "IMS 2025"
-        # }
-        # df_master = xl.parse(sheet_name_map.get(category, xl.sheet_names[0]))
+        with phase("parse"):
+            workbook = load_workbook(user_file)
 
         category = user_file.category.upper()
         company = user_file.company.upper()
 
         # 🔴 SPECIAL CASE: CSPL + ISMS (vertical)
         if company == "CSPL" and category == "ISMS":
-            df_master = read_vertical_excel_as_df(
-                user_file.file_path,
-                engine="openpyxl"
-            )
-
-        else:
-            sheet_name_map = {
-                "QMS": "QMS 2025",
-                "EMS": "EMS 2025",
-                "OHSMS": "OHSMS 2025",
-                "IMS": "IMS 2025"
-            }
-
-            df_master = xl.parse(sheet_name_map.get(category, xl.sheet_names[0]))
-            df_master.columns = [c.strip().replace(" ", "_").replace("/", "_") for c in df_master.columns]
-
-        # --- Load checklist sheet ---
-        checklist_sheets = [s for s in xl.sheet_names if category in s and "Checklist" in s]
-        # if checklist_sheets:
-        #     df_checklist = xl.parse(checklist_sheets[0])
-        #     df_checklist.columns = [c.strip().replace(" ", "_").replace("/", "_") for c in df_checklist.columns]
-        #     # Normalize Certificate_No
-        #     if "Certificate_No" in df_checklist.columns:
-        #         df_checklist["Certificate_No"] = df_checklist["Certificate_No"].astype(str).str.strip().str.upper()
-        #     checklist_certs = set(df_checklist["Certificate_No"].tolist())
-        # else:
-        #     checklist_certs = set()
-
-        if checklist_sheets:
-            df_checklist = xl.parse(checklist_sheets[0])
-            df_checklist.columns = [c.strip().replace(" ", "_").replace("/", "_") for c in df_checklist.columns]
-
-            # For IMS, map Certificate_No_QMS
-            if category == "IMS" and "Certificate_No_QMS" in df_checklist.columns:
-                df_checklist["Certificate_No"] = df_checklist["Certificate_No_QMS"].astype(str).str.strip().str.upper()
-            elif "Certificate_No" in df_checklist.columns:
-                df_checklist["Certificate_No"] = df_checklist["Certificate_No"].astype(str).str.strip().str.upper()
-
-            checklist_certs = set(df_checklist["Certificate_No"].tolist())
+            df_master = workbook.records
         else:
-            checklist_certs = set()
+            df_master = workbook.master(category)
 
-        # --- Prepare master rows ---
-        df_master.reset_index(inplace=True)
-        df_master.rename(columns={"index": "id"}, inplace=True)
-        df_master["id"] = df_master["id"] + 1
+        with phase("annotate"):
+            checklist_certs = checklist_certificates(workbook.checklist(category), category)
 
-        # if "Certificate_No" in df_master.columns:
-        #     df_master["Certificate_No"] = df_master["Certificate_No"].astype(str).str.strip().str.upper()
-
-        if category == "IMS":
-            cert_col = "Certificate_No_QMS" if "Certificate_No_QMS" in df_master.columns else None
-        else:
-            cert_col = "Certificate_No" if "Certificate_No" in df_master.columns else None
-
-        if cert_col:
-            df_master["Certificate_No"] = (
-                df_master[cert_col].astype(str).str.strip().str.upper()
+            generated_rows, generated_checklists = generated_row_ids(
+                current_user_id, user_file.category, user_file.company
             )
-        else:
-            df_master["Certificate_No"] = None
-
-        # Mark rows for which checklist exists
-        df_master["ChecklistAvailable"] = df_master["Certificate_No"].apply(lambda x: x in checklist_certs)
-
-        # Mark rows already generated
-        # generated_rows = {
-        #     g.row_id
-        #     for g in GeneratedDoc.query.filter_by(user_id=current_user_id, category=user_file.category).all()
-        # }
-
-        generated_rows = {
-            g.row_id
-            for g in GeneratedDoc.query.filter_by(
-                user_id=current_user_id,
-                category=user_file.category,
-                company=user_file.company   # NEW ✔
-            ).all()
-        }
 
-        df_master["Status"] = df_master["id"].apply(lambda x: "Generated" if x in generated_rows else "Pending")
+            df_master = annotate_rows(df_master, category, checklist_certs, generated_rows, generated_checklists)
 
-        # generated_checklists = {
-        #     c.row_id
-        #     for c in ChecklistDoc.query.filter_by(user_id=current_user_id, category=user_file.category).all()
-        # }
+            df_master, page = query_frame(df_master, request.args)
 
-        generated_checklists = {
-            c.row_id
-            for c in ChecklistDoc.query.filter_by(
-                user_id=current_user_id,
-                category=user_file.category,
-                company=user_file.company   # NEW ✔
-            ).all()
-        }
-        
-        df_master["ChecklistGenerated"] = df_master["id"].apply(lambda x: x in generated_checklists)
-
-        df_master = df_master.replace({np.nan: None, np.inf: None, -np.inf: None})
-
-        return jsonify(df_master.to_dict(orient="records"))
+        # Plain list and paged envelope both go through jsonify, so values are
+        # encoded the same way whichever the client asked for
+        with phase("serialize") as timing:
+            rows = rows_records(df_master)
+            response = jsonify(rows if page is None else {"rows": rows, **page})
+            timing.nbytes = response.content_length
+        return response
 
+    except QueryError as e:
+        return {"error": str(e)}, 400
     except Exception as e:
         return {"error": str(e)}, 500
 
@@ -1088,17 +1893,13 @@ def get_generated_docs():
     category = request.args.get("category", None)
     company = request.args.get("company")
 
-    query = GeneratedDoc.query.filter_by(user_id=current_user_id)
+    query = document_listing(GeneratedDoc).filter_by(user_id=current_user_id)
 
     if category:
-        query = query.filter(
-            db.func.lower(db.func.trim(GeneratedDoc.category)) == category.strip().lower()
-        )
+        query = query.filter_by(category=normalize_code(category))
 
     if company:
-        query = query.filter(
-            db.func.lower(db.func.trim(GeneratedDoc.company)) == company.strip().lower()
-        )
+        query = query.filter_by(company=normalize_code(company))
 
     docs = query.order_by(GeneratedDoc.created_at.desc()).all()
 
@@ -1123,7 +1924,7 @@ def download_generated_file(file_name):
         return {"error": "File not found or access denied"}, 404
 
     return send_file(
-        io.BytesIO(doc.file_data),
+        io.BytesIO(document_bytes(doc)),
         as_attachment=True,
         download_name=doc.file_name,
         mimetype="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
@@ -1140,35 +1941,131 @@ def init_db():
 
 ## Admin Routes
 
+def admin_listing_filters(query, model, timestamp_column, args):
+    """
+    Filters shared by the admin listings: user_id, username, company,
+    category, and from / to (YYYY-MM-DD, inclusive) on the listing's timestamp.
+    """
+    if args.get("user_id"):
+        try:
+            query = query.filter(model.user_id == int(args["user_id"]))
+        except ValueError:
+            raise QueryError("user_id must be an integer")
+
+    if args.get("username"):
+        query = query.filter(User.username == args["username"].strip())
+
+    for name in ("company", "category"):
+        if args.get(name):
+            query = query.filter(getattr(model, name) == normalize_code(args[name]))
+
+    for name in ("from", "to"):
+        if not args.get(name):
+            continue
+        try:
+            day = date.fromisoformat(args[name])
+        except ValueError:
+            raise QueryError(f"{name} must be a date (YYYY-MM-DD)")
+        if name == "from":
+            query = query.filter(timestamp_column >= datetime.combine(day, datetime.min.time()))
+        else:
+            query = query.filter(timestamp_column < datetime.combine(day + timedelta(days=1), datetime.min.time()))
+
+    return query
+
+
+def admin_listing_query(model, columns, timestamp_column, args):
+    """Just ``columns`` plus the owner's username, joined in the same query"""
+    query = db.session.query(*columns, User.username).join(User, model.user_id == User.id)
+    return admin_listing_filters(query, model, timestamp_column, args)
+
+
+def admin_listing(model, columns, timestamp_column):
+    """One page (or, without limit / cursor, all) of an admin listing, newest first"""
+    query = admin_listing_query(model, columns, timestamp_column, request.args)
+    return keyset_page(query, timestamp_column, model.id, request.args)
+
+
+def admin_listing_response(rows, next_cursor):
+    # Paged responses are an envelope; unpaged ones stay the plain array older clients expect
+    if wants_keyset(request.args):
+        return jsonify({"rows": rows, "next_cursor": next_cursor})
+    return jsonify(rows)
+
+
 @app.route("/admin/all-files", methods=["GET"])
 @admin_required
 def admin_all_files():
-    files = UserFile.query.all()
-    return jsonify([
+    try:
+        files, next_cursor = admin_listing(UserFile, (
+            UserFile.id, UserFile.file_name, UserFile.category, UserFile.uploaded_at, UserFile.source_type
+        ), UserFile.uploaded_at)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return admin_listing_response([
         {
             "id": f.id,
-            "username": f.user.username,
+            "username": f.username,
             "file_name": f.file_name,
             "category": f.category,
             "uploaded_at": f.uploaded_at.strftime("%Y-%m-%d %H:%M:%S"),
             "source_type": f.source_type
         } for f in files
-    ])
+    ], next_cursor)
 
 @app.route("/admin/generated-docs", methods=["GET"])
 @admin_required
 def admin_generated_docs():
-    docs = GeneratedDoc.query.order_by(GeneratedDoc.created_at.desc()).all()
-    return jsonify([
+    try:
+        docs, next_cursor = admin_listing(GeneratedDoc, (
+            GeneratedDoc.id, GeneratedDoc.row_id, GeneratedDoc.file_name, GeneratedDoc.category, GeneratedDoc.created_at
+        ), GeneratedDoc.created_at)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return admin_listing_response([
         {
             "id": d.id,
-            "username": d.user.username,
+            "username": d.username,
             "row_id": d.row_id,
             "file_name": d.file_name,
             "category": d.category,
             "created_at": d.created_at.strftime("%Y-%m-%d %H:%M:%S")
         } for d in docs
+    ], next_cursor)
+
+@app.route("/admin/cache-stats", methods=["GET"])
+@admin_required
+def admin_cache_stats():
+    return jsonify({
+        "render_cache": render_cache.stats(),
+        "templates": template_registry.stats(),
+        "workbooks": workbook_cache.stats(),
+        "users": user_states.stats(),
+        "db_pool": {**DB_POOL_SETTINGS, **pool_metrics.stats(db.engine.pool)},
+    })
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    # Scrapers do not log in; they send METRICS_TOKEN as a bearer token
+    authorization = request.headers.get("Authorization", "")
+    allowed = bool(METRICS_TOKEN) and hmac.compare_digest(
+        authorization.encode(), f"Bearer {METRICS_TOKEN}".encode()
+    )
+    if not allowed and METRICS_ALLOW_LOCAL:
+        allowed = request.remote_addr in ("127.0.0.1", "::1") and "X-Forwarded-For" not in request.headers
+    if not allowed:
+        abort(404)
+
+    body = request_metrics.prometheus() + "".join([
+        stats_gauges("render_cache", render_cache.stats()),
+        stats_gauges("templates", template_registry.stats()),
+        stats_gauges("workbook_cache", workbook_cache.stats()),
+        stats_gauges("user_states", user_states.stats()),
+        stats_gauges("db_pool", pool_metrics.stats(db.engine.pool)),
     ])
+    return Response(body, content_type=PROMETHEUS_CONTENT_TYPE)
 
 @app.route("/create-initial-admin", methods=["POST"])
 def create_initial_admin():
@@ -1184,25 +2081,26 @@ def create_initial_admin():
 
     db.session.add(admin)
     db.session.commit()
+    user_states.invalidate(admin.id)
 
     return {"message": f"Initial admin '{username}' created"}, 201
 
 @app.route("/admin/files", methods=["GET"])
 @jwt_required()
 def get_all_files():
-    current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
+    user = current_user_state()
 
     if not user or user.role != "admin":
         return {"error": "Unauthorized"}, 403
 
-    user_id = request.args.get("user_id")
-    files_data = []
+    try:
+        generated_files, next_cursor = admin_listing(GeneratedDoc, (
+            GeneratedDoc.id, GeneratedDoc.file_name, GeneratedDoc.category, GeneratedDoc.created_at
+        ), GeneratedDoc.created_at)
+    except QueryError as e:
+        return {"error": str(e)}, 400
 
-    if user_id:
-        generated_files = GeneratedDoc.query.filter_by(user_id=user_id).all()
-    else:
-        generated_files = GeneratedDoc.query.all()
+    files_data = []
 
     for g in generated_files:
         files_data.append({
@@ -1210,17 +2108,19 @@ def get_all_files():
             "file_name": g.file_name,
             "category": g.category,
             "uploaded_at": g.created_at,
-            "user": g.user.username,
+            "user": g.username,
             "source": "generated"
         })
 
-    return {"files": files_data}, 200
+    response = {"files": files_data}
+    if wants_keyset(request.args):
+        response["next_cursor"] = next_cursor
+    return response, 200
 
 @app.route("/download/<string:source>/<int:file_id>", methods=["GET"])
 @jwt_required()
 def download_file(source, file_id):
-    current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
+    user = current_user_state()
 
     if not user or user.role != "admin":
         return {"error": "Unauthorized"}, 403
@@ -1230,6 +2130,17 @@ def download_file(source, file_id):
         if not file:
             return abort(404, "File not found")
 
+        if file.source_type == "generated" and not (file.file_path and os.path.exists(file.file_path)):
+            data = generated_file_bytes(file)
+            if data is None:
+                return abort(404, "File not found")
+            return send_file(
+                io.BytesIO(data),
+                as_attachment=True,
+                download_name=file.file_name,
+                mimetype="application/octet-stream"
+            )
+
         if not file.file_path or not os.path.exists(file.file_path):
             return abort(404, "File path not valid")
 
@@ -1245,7 +2156,7 @@ def download_file(source, file_id):
             return abort(404, "File not found")
 
         return send_file(
-            io.BytesIO(file.file_data),
+            io.BytesIO(document_bytes(file)),
             as_attachment=True,
             download_name=file.file_name,
             mimetype="application/octet-stream"
@@ -1256,7 +2167,7 @@ def download_file(source, file_id):
 
 @app.route("/all-generated-docs", methods=["GET"])
 def get_all_generated_docs():
-    docs = GeneratedDoc.query.all()
+    docs = document_listing(GeneratedDoc).all()
     return jsonify([
         {
             "id": d.id,
@@ -1269,147 +2180,114 @@ def get_all_generated_docs():
 
 ########################################## CHECKLIST CODE  ###########################################
 
-@app.route("/generate-checklist/<int:file_id>/<int:row_id>", methods=["GET"])
-@jwt_required()
-def generate_checklist(file_id, row_id):
-    try:
-        current_user_id = int(get_jwt_identity())
-
-        user_file = UserFile.query.filter_by(
-            id=file_id,
-            user_id=current_user_id,
-            source_type="uploaded"
-        ).first()
-        if not user_file:
-            return jsonify({"error": "File not found or access denied"}), 404
-
-        category = user_file.category.upper()
-        company = request.args.get("company", user_file.company).upper()
-
-        if company not in CATEGORY_CHECKLIST_TEMPLATES:
-            return jsonify({"error": f"Invalid company: {company}"}), 400
+def generate_checklist_document(user_id, file_id, row_id, company=None):
+    """Renders and stores the audit checklist for one master row"""
+    user_file = uploaded_file_for(user_id, file_id)
 
-        if category not in CATEGORY_CHECKLIST_TEMPLATES[company]:
-            return jsonify({"error": f"No checklist templates for {company} - {category}"}), 400
+    category = user_file.category.upper()
+    company = (company or user_file.company).upper()
 
-        template_candidates = CATEGORY_CHECKLIST_TEMPLATES[company][category]
+    if company not in CATEGORY_CHECKLIST_TEMPLATES:
+        raise GenerationError(f"Invalid company: {company}")
 
-        if not template_candidates:
-            return jsonify({"error": f"No checklist templates found for {company}-{category}"}), 400
+    if category not in CATEGORY_CHECKLIST_TEMPLATES[company]:
+        raise GenerationError(f"No checklist templates for {company} - {category}")
 
-        template_file = random.choice(template_candidates)
+    template_candidates = CATEGORY_CHECKLIST_TEMPLATES[company][category]
 
-        if not os.path.exists(template_file):
-            return jsonify({"error": f"Template file not found: {template_file}"}), 400
-
-        ext = user_file.file_path.lower().split(".")[-1]
+    if not template_candidates:
+        raise GenerationError(f"No checklist templates found for {company}-{category}")
 
-        if ext in ["xlsm", "xlsx"]:
-            xl = pd.ExcelFile(user_file.file_path, engine="openpyxl")
-        elif ext == "xls":
-            xl = pd.ExcelFile(user_file.file_path, engine="xlrd")
-        elif ext == "csv":
-            return jsonify({"error": "Checklist generation not supported for CSV"}), 400
-        else:
-            return jsonify({"error": f"Unsupported file type: {ext}"}), 400
+    template_file = random.choice(template_candidates)
 
-        print("Sheets found in Excel:", xl.sheet_names)
+    if not os.path.exists(template_file):
+        raise GenerationError(f"Template file not found: {template_file}")
 
-        sheet_name_map = {
-            "QMS": "QMS 2025",
-            "EMS": "EMS 2025",
-            "OHSMS": "OHSMS 2025",
-            "IMS": "IMS 2025",
-        }
+    ext = user_file.file_path.lower().split(".")[-1]
 
-        main_sheet = sheet_name_map.get(category)
+    if ext == "csv":
+        raise GenerationError("Checklist generation not supported for CSV")
+    elif ext not in ["xlsm", "xlsx", "xls"]:
+        raise GenerationError(f"Unsupported file type: {ext}")
 
-        if main_sheet not in xl.sheet_names:
-            return jsonify({"error": f"Master sheet '{main_sheet}' not found"}), 400
+    with phase("parse"):
+        workbook = lookup_workbook(user_file)
 
-        df_master = xl.parse(main_sheet)
-        df_master.columns = [c.strip().replace(" ", "_").replace("/", "_") for c in df_master.columns]
+    main_sheet = MASTER_SHEET_NAMES.get(category)
 
-        sheet_candidates = [s for s in xl.sheet_names if category in s and "Checklist" in s]
+    if main_sheet not in workbook.sheet_names:
+        raise GenerationError(f"Master sheet '{main_sheet}' not found")
 
-        if not sheet_candidates:
-            return jsonify({"error": f"No checklist sheet found for {category}"}), 404
+    checklist_sheet = workbook.checklist_sheet_name(category)
 
-        df_checklist = xl.parse(sheet_candidates[0])
-        df_checklist.columns = [c.strip().replace(" ", "_").replace("/", "_") for c in df_checklist.columns]
+    if checklist_sheet is None:
+        raise GenerationError(f"No checklist sheet found for {category}", 404)
 
-        master_row = df_master.reset_index()
-        master_row.rename(columns={"index": "id"}, inplace=True)
-        master_row["id"] = master_row["id"] + 1
+    with phase("parse"):
+        master_data = workbook.row(main_sheet, row_id)
 
-        selected_row = master_row[master_row["id"] == row_id].to_dict(orient="records")
+    if master_data is None:
+        raise GenerationError("Row not found in master sheet", 404)
 
-        if not selected_row:
-            return jsonify({"error": "Row not found in master sheet"}), 404
+    match_column = "Certificate_No_QMS" if category == "IMS" else "Certificate_No"
+    certificate_no = master_data.get(match_column)
 
-        master_data = selected_row[0]
+    if not certificate_no or str(certificate_no).strip().lower() in ["", "none", "null"]:
+        raise GenerationError(f"No valid {match_column} found for row")
 
-        match_column = "Certificate_No_QMS" if category == "IMS" else "Certificate_No"
-        certificate_no = master_data.get(match_column)
+    if match_column not in workbook.columns(checklist_sheet):
+        raise GenerationError(f"Checklist missing required column {match_column}")
 
-        if not certificate_no or str(certificate_no).strip().lower() in ["", "none", "null"]:
-            return jsonify({"error": f"No valid {match_column} found for row"}), 400
+    with phase("parse"):
+        checklist_row = workbook.first_match(checklist_sheet, match_column, certificate_no)
 
-        if match_column not in df_checklist.columns:
-            return jsonify({"error": f"Checklist missing required column {match_column}"}), 400
+    if checklist_row is None:
+        raise GenerationError(f"No checklist entry for {match_column} = {certificate_no}", 404)
 
-        checklist_row = df_checklist[df_checklist[match_column] == certificate_no].to_dict(orient="records")
+    context = checklist_context(master_data, checklist_row)
 
-        if not checklist_row:
-            return jsonify({"error": f"No checklist entry for {match_column} = {certificate_no}"}), 404
+    data = render_document(template_file, context, certificate=False)
 
-        row_data = checklist_row[0]
+    file_name_safe = checklist_file_name(context, category, f"record_{file_id}_{row_id}")
+    return store_document(
+        ChecklistDoc, user_id, row_id, file_name_safe, data, category, company
+    )
 
-        context = {**master_data, **row_data}
 
-        for k, v in context.items():
-            if isinstance(v, pd.Timestamp):
-                context[k] = v.strftime("%d-%m-%Y")
-            elif pd.isna(v) or str(v).strip().lower() == "null":
-                context[k] = "NA"
-            elif isinstance(v, str):
-                context[k] = v.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+@job_handler("checklist")
+def run_checklist_job(job, params):
+    doc, _ = generate_checklist_document(job.user_id, **params)
+    report_progress(job, {"row_id": doc.row_id, "file_name": doc.file_name, "source": "ChecklistDoc", "doc_id": doc.id})
 
-        doc = DocxTemplate(template_file)
-        doc.render(context)
 
-        org_name = context.get("Organization_Name", f"record_{file_id}_{row_id}")
-        org_name_safe = re.sub(r"[^\w]", "_", org_name).strip("_")
+@app.route("/generate-checklist/<int:file_id>/<int:row_id>", methods=["GET"])
+@jwt_required()
+@traced("generate_checklist")
+def generate_checklist(file_id, row_id):
+    try:
+        current_user_id = int(get_jwt_identity())
 
-        file_name_safe = f"{org_name_safe}_{category}_checklist.docx"
-        output_path = os.path.join(OUTPUT_DIR, file_name_safe)
+        params = {
+            "file_id": file_id,
+            "row_id": row_id,
+            "company": request.args.get("company"),
+        }
 
-        doc.save(output_path)
+        if wants_async():
+            uploaded_file_for(current_user_id, file_id)
+            return job_accepted(enqueue_job(current_user_id, "checklist", params))
 
-        with open(output_path, "rb") as f:
-            new_record = ChecklistDoc(
-                row_id=row_id,
-                file_name=file_name_safe,
-                file_data=f.read(),
-                user_id=current_user_id,
-                category=category,
-                company=company
-            )
-            db.session.add(new_record)
+        doc, data = generate_checklist_document(current_user_id, **params)
 
-        generated_file = UserFile(
-            user_id=current_user_id,
-            file_name=file_name_safe,
-            file_path=output_path,
-            source_type="generated",
-            category=category,
-            company=company
+        return send_file(
+            io.BytesIO(data),
+            as_attachment=True,
+            download_name=doc.file_name,
+            mimetype=DOCX_MIMETYPE
         )
-        db.session.add(generated_file)
-
-        db.session.commit()
 
-        return send_file(output_path, as_attachment=True, download_name=file_name_safe)
+    except GenerationError as e:
+        return jsonify({"error": str(e)}), e.status_code
 
     except Exception as e:
         traceback.print_exc()
@@ -1421,7 +2299,7 @@ def generate_checklist(file_id, row_id):
 def delete_generated_doc(category, row_id):
     try:
         current_user_id = int(get_jwt_identity())
-        category = category.upper()
+        category = normalize_code(category)
 
         docs = GeneratedDoc.query.filter_by(row_id=row_id, user_id=current_user_id, category=category).all()
         if not docs:
@@ -1446,7 +2324,7 @@ def delete_generated_doc(category, row_id):
 def delete_checklist(category, row_id):
     try:
         current_user_id = int(get_jwt_identity())
-        category = category.upper()
+        category = normalize_code(category)
 
         checklist_docs = ChecklistDoc.query.filter_by(
             row_id=row_id, user_id=current_user_id, category=category
@@ -1476,17 +2354,13 @@ def get_generated_checklists():
     category = request.args.get("category", None)
     company = request.args.get("company", None)
 
-    query = ChecklistDoc.query.filter_by(user_id=current_user_id)
+    query = document_listing(ChecklistDoc).filter_by(user_id=current_user_id)
 
     if category:
-        query = query.filter(
-            db.func.lower(db.func.trim(ChecklistDoc.category)) == category.strip().lower()
-        )
+        query = query.filter_by(category=normalize_code(category))
 
     if company:
-        query = query.filter(
-            db.func.lower(db.func.trim(ChecklistDoc.company)) == company.strip().lower()
-        )
+        query = query.filter_by(company=normalize_code(company))
 
     docs = query.order_by(ChecklistDoc.created_at.desc()).all()
 
@@ -1511,11 +2385,273 @@ def download_checklist_file(file_name):
         return {"error": "File not found or access denied"}, 404
 
     return send_file(
-        io.BytesIO(doc.file_data),
+        io.BytesIO(document_bytes(doc)),
         as_attachment=True,
         download_name=doc.file_name,
         mimetype="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
     )
 
+ARCHIVE_FOLDERS = {GeneratedDoc: "Certificates", ChecklistDoc: "Checklists"}
+
+
+def archive_entries(docs):
+    """
+    ``(arcname, load, modified)`` entries for stream_zip from
+    ``(model, id, file_name, created_at)`` rows; blobs are read one by one.
+    """
+    for model, doc_id, file_name, created_at in docs:
+        def load(model=model, doc_id=doc_id):
+            row = db.session.query(model.blob_hash, model.file_data).filter(model.id == doc_id).first()
+            if row is None:
+                return None
+            return blob_store.get(row.blob_hash) if row.blob_hash else row.file_data
+
+        yield f"{ARCHIVE_FOLDERS[model]}/{file_name}", load, created_at
+
+
+def zip_response(docs, download_name):
+    response = Response(
+        stream_with_context(stream_zip(archive_entries(docs))),
+        mimetype="application/zip"
+    )
+    response.headers["Content-Disposition"] = f"attachment; filename={download_name}"
+    response.headers["Access-Control-Expose-Headers"] = "Content-Disposition"
+    return response
+
+
+@app.route("/download-zip", methods=["GET"])
+@jwt_required()
+def download_zip():
+    """
+    Streams the user's documents as one ZIP.
+    Filters: source (generated | checklist | all), category, company,
+    date_from / date_to (YYYY-MM-DD, inclusive), job_id.
+    """
+    current_user_id = int(get_jwt_identity())
+
+    source = request.args.get("source", "all").lower()
+    category = request.args.get("category")
+    company = request.args.get("company")
+    job_id = request.args.get("job_id")
+
+    models = {
+        "generated": [GeneratedDoc],
+        "checklist": [ChecklistDoc],
+        "all": [GeneratedDoc, ChecklistDoc],
+    }.get(source)
+    if not models:
+        return {"error": f"Invalid source: {source}"}, 400
+
+    try:
+        date_from = request.args.get("date_from")
+        date_from = datetime.strptime(date_from, "%Y-%m-%d") if date_from else None
+        date_to = request.args.get("date_to")
+        date_to = datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1) if date_to else None
+    except ValueError:
+        return {"error": "Dates must be YYYY-MM-DD"}, 400
+
+    job_doc_ids = None
+    if job_id:
+        job = GenerationJob.query.filter_by(id=job_id, user_id=current_user_id).first()
+        if not job:
+            return {"error": "Job not found"}, 404
+        job_doc_ids = {
+            (r["source"], r["doc_id"]) for r in job_to_dict(job)["results"] if "doc_id" in r
+        }
+
+    docs = []
+    for model in models:
+        query = db.session.query(model.id, model.file_name, model.created_at) \
+            .filter(model.user_id == current_user_id)
+
+        if category:
+            query = query.filter(model.category == normalize_code(category))
+        if company:
+            query = query.filter(model.company == normalize_code(company))
+        if date_from:
+            query = query.filter(model.created_at >= date_from)
+        if date_to:
+            query = query.filter(model.created_at < date_to)
+
+        for doc_id, file_name, created_at in query.order_by(model.created_at).all():
+            if job_doc_ids is None or (model.__name__, doc_id) in job_doc_ids:
+                docs.append((model, doc_id, file_name, created_at))
+
+    if not docs:
+        return {"error": "No documents match"}, 404
+
+    return zip_response(docs, f"documents_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.zip")
+
+@app.cli.command("upgrade-schema")
+def upgrade_schema_command():
+    """Adds the tables, columns and indexes an existing database is missing; run once per deploy"""
+    db.create_all()
+    try:
+        upgrade_schema()
+    except SchemaUpgradeError as e:
+        raise click.ClickException(str(e))
+    print("✅ Schema is up to date")
+
+
+@app.cli.command("migrate-blobs")
+@click.option("--batch-size", default=100, show_default=True, help="Documents per transaction")
+def migrate_blobs(batch_size):
+    """Moves inline file_data of existing documents into the blob store"""
+    for model in (GeneratedDoc, ChecklistDoc):
+        moved = 0
+        while True:
+            ids = [
+                doc_id for (doc_id,) in db.session.query(model.id)
+                .filter(model.file_data.isnot(None), model.blob_hash.is_(None))
+                .order_by(model.id)
+                .limit(batch_size)
+            ]
+            if not ids:
+                break
+
+            for doc_id in ids:
+                data = db.session.query(model.file_data).filter(model.id == doc_id).scalar()
+                blob_hash, blob_size = blob_store.put(data)
+                model.query.filter_by(id=doc_id).update({
+                    "blob_hash": blob_hash,
+                    "blob_size": blob_size,
+                    "file_data": None,
+                }, synchronize_session=False)
+
+            db.session.commit()
+            db.session.expunge_all()
+            moved += len(ids)
+            print(f"{model.__name__}: moved {moved}")
+
+        print(f"✅ {model.__name__}: {moved} document(s) moved to the blob store")
+
+
+@app.cli.command("gc-blobs")
+@click.option("--dry-run", is_flag=True, help="Only report unreferenced blobs")
+def gc_blobs(dry_run):
+    """
+    Deletes blobs no document or file row points at any more. Run it while no
+    generation is in flight: a blob written just before its row is committed looks unreferenced.
+    """
+    referenced = set()
+    for model in (GeneratedDoc, ChecklistDoc, UserFile):
+        referenced.update(
+            h for (h,) in db.session.query(model.blob_hash).filter(model.blob_hash.isnot(None)).distinct()
+        )
+
+    orphans = [key for key in blob_store.keys() if key not in referenced]
+    for key in orphans:
+        if not dry_run:
+            blob_store.delete(key)
+
+    print(f"{'Would delete' if dry_run else 'Deleted'} {len(orphans)} unreferenced blob(s)")
+
+
+def hot_queries():
+    """(label, statement, indexes it must use) for the lookups every request depends on"""
+    def by_file_name(model):
+        return model.query.filter_by(user_id=1, file_name="x.docx").statement
+
+    def admin_page(model, timestamp_column):
+        # A later page of an unfiltered admin listing
+        args = {"limit": "100", "cursor": encode_cursor(datetime(2025, 1, 1), 1)}
+        query = admin_listing_query(model, (model.id, timestamp_column), timestamp_column, args)
+        return keyset_query(query, timestamp_column, model.id, args).statement
+
+    return [
+        ("status row ids",
+         generated_row_ids_query(1, "QMS", "APL"),
+         ["ix_generated_doc_scope_row", "ix_checklist_docs_scope_row"]),
+        ("certificate listing",
+         document_listing(GeneratedDoc).filter_by(user_id=1, category="QMS", company="APL")
+         .order_by(GeneratedDoc.created_at.desc()).statement,
+         ["ix_generated_doc_scope_row"]),
+        ("checklist listing",
+         document_listing(ChecklistDoc).filter_by(user_id=1, category="QMS", company="APL")
+         .order_by(ChecklistDoc.created_at.desc()).statement,
+         ["ix_checklist_docs_scope_row"]),
+        ("certificate download", by_file_name(GeneratedDoc), ["ix_generated_doc_user_file_name"]),
+        ("checklist download", by_file_name(ChecklistDoc), ["ix_checklist_docs_user_file_name"]),
+        ("my files",
+         UserFile.query.filter_by(user_id=1, source_type="uploaded").statement,
+         ["ix_user_files_user_source"]),
+        ("admin documents page",
+         admin_page(GeneratedDoc, GeneratedDoc.created_at),
+         ["ix_generated_doc_created"]),
+        ("admin uploads page",
+         admin_page(UserFile, UserFile.uploaded_at),
+         ["ix_user_files_uploaded"]),
+        ("duplicate upload",
+         duplicate_upload_query(1, "uploads/1/x.xlsx", "0" * 64, "QMS", "APL").statement,
+         ["ix_user_files_user_content_hash"]),
+    ]
+
+
+def explain(conn, statement):
+    sql = str(statement.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    if conn.dialect.name == "sqlite":
+        return "\n".join(row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}"))
+    # Tiny tables are always cheapest to scan; make the planner show what it would use
+    conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    return "\n".join(row[0] for row in conn.exec_driver_sql(f"EXPLAIN {sql}"))
+
+
+@app.cli.command("gc-upload-sessions")
+@click.option("--max-age-hours", default=UPLOAD_SESSION_MAX_AGE_HOURS, show_default=True,
+              help="Discard sessions that have not received a chunk for this long")
+def gc_upload_sessions(max_age_hours):
+    """Deletes abandoned chunked uploads and their part files"""
+    cutoff = datetime.utcnow() - timedelta(hours=max_age_hours)
+    stale = UploadSession.query.filter(UploadSession.updated_at < cutoff).all()
+    for session in stale:
+        discard_upload_session(session)
+    print(f"Discarded {len(stale)} upload session(s) idle since before {cutoff:%Y-%m-%d %H:%M}")
+
+
+@app.cli.command("check-query-plans")
+@click.option("--verbose", is_flag=True, help="Print every plan")
+def check_query_plans(verbose):
+    """Fails when a hot lookup no longer uses the index it was built for"""
+    if db.engine.dialect.name not in ("sqlite", "postgresql"):
+        raise click.ClickException(f"No plan check for {db.engine.dialect.name}")
+
+    failures = []
+    with db.engine.connect() as conn:
+        for label, statement, indexes in hot_queries():
+            with conn.begin():
+                plan = explain(conn, statement)
+            missing = [name for name in indexes if name not in plan]
+            print(f"{'❌' if missing else '✅'} {label}")
+            if verbose or missing:
+                print("    " + plan.replace("\n", "\n    "))
+            if missing:
+                failures.append(f"{label}: expected {', '.join(missing)}")
+
+    if failures:
+        raise click.ClickException("Query plan regressions:\n" + "\n".join(failures))
+
+
+# In-process job workers; set JOB_WORKER_THREADS=0 when running worker.py instead.
+# Threads do not survive a fork, so they are started in each process that
+# serves requests, not at import: by gunicorn's post_worker_init hook
+# (gunicorn.conf.py), or below for "python app.py".
+JOB_WORKER_THREADS = int(os.getenv("JOB_WORKER_THREADS", "1"))
+_job_workers_pid = None
+
+
+def start_job_workers():
+    global _job_workers_pid
+    if JOB_WORKER_THREADS <= 0 or _job_workers_pid == os.getpid():
+        return
+    _job_workers_pid = os.getpid()
+
+    if JOB_WORKER_THREADS >= DB_POOL_SETTINGS["pool_size"] + DB_POOL_SETTINGS["max_overflow"]:
+        print(f"⚠️ {JOB_WORKER_THREADS} job worker threads can hold every pooled connection; raise DB_POOL_SIZE")
+    start_worker_threads(app, JOB_WORKER_THREADS)
+
+
 if __name__ == "__main__":
+    # With the reloader, only the child process that serves requests runs jobs
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_job_workers()
     app.run(debug=True)
\ No newline at end of file
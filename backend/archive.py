@@ -0,0 +1,79 @@
+"""
+ZIP archives produced chunk by chunk, so a large audit pack never has to
+be built in memory.
+"""
+import zipfile
+from datetime import datetime
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class _StreamBuffer:
+    """Write-only sink for ZipFile; what it receives is drained by stream_zip"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        if self._chunks:
+            data = b"".join(self._chunks)
+            self._chunks = []
+            yield data
+
+
+def unique_name(name, used):
+    """``name``, or ``name (2)``/``name (3)``... when already taken in the archive"""
+    if name not in used:
+        used.add(name)
+        return name
+
+    stem, dot, ext = name.rpartition(".")
+    if not dot:
+        stem, ext = name, ""
+    n = 2
+    while True:
+        candidate = f"{stem} ({n}).{ext}" if dot else f"{stem} ({n})"
+        if candidate not in used:
+            used.add(candidate)
+            return candidate
+        n += 1
+
+
+def stream_zip(entries):
+    """
+    Yields the bytes of a ZIP archive built from ``(arcname, load, modified)``
+    entries, where ``load()`` returns the member's bytes. Members are loaded
+    one at a time and stored uncompressed (DOCX files are already zipped).
+    """
+    buffer = _StreamBuffer()
+    used = set()
+
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for arcname, load, modified in entries:
+            data = load()
+            if data is None:
+                continue
+
+            info = zipfile.ZipInfo(
+                unique_name(arcname, used),
+                date_time=(modified or datetime.now()).timetuple()[:6]
+            )
+            info.compress_type = zipfile.ZIP_STORED
+
+            with zf.open(info, mode="w", force_zip64=len(data) > 0x7FFFFFFF) as member:
+                for start in range(0, len(data), CHUNK_SIZE):
+                    member.write(data[start:start + CHUNK_SIZE])
+                    yield from buffer.drain()
+
+            del data
+            yield from buffer.drain()
+
+    yield from buffer.drain()
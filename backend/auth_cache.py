@@ -0,0 +1,61 @@
+"""
+What the database currently says about each user (role, username), kept for
+a short TTL so checking a token's claims does not cost a query per request.
+
+Tokens carry role and username as claims from login. A token whose claims no
+longer match, or whose user is gone, stops working within ``ttl`` seconds of
+the change, in every process.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+
+UserState = namedtuple("UserState", ["role", "username"])
+
+
+class UserStateCache:
+    def __init__(self, loader, ttl=60, max_entries=10000):
+        # loader(user_id) -> UserState, or None when there is no such user
+        self.loader = loader
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+
+        # A missing user is cached too, so a revoked token cannot force a query per request
+        state = self.loader(user_id)
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, state)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.loads += 1
+        return state
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "loads": self.loads,
+            }
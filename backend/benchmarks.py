@@ -0,0 +1,412 @@
+"""
+Micro-benchmarks for the hot paths of the backend.
+
+Each benchmark runs against a throwaway SQLite database in a temporary
+directory (never the configured DATABASE_URL), so it is safe to run
+anywhere:
+
+    python benchmarks.py listing --rows 10000 --blob-kb 64
+    python benchmarks.py annotate --sizes 1000,10000,100000
+    python benchmarks.py upload --sizes 1000,50000
+    python benchmarks.py admin --rows 200000
+    python benchmarks.py login --rounds 10,12 --clients 8
+    python benchmarks.py pool --threads 16 --sizes 2,8,16
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+def isolated_app():
+    """Imports app.py against a fresh SQLite database in a temp directory"""
+    workdir = tempfile.mkdtemp(prefix="kvqa-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret-key-benchmark-secret-key")
+    os.environ["BLOB_STORE_DIR"] = os.path.join(workdir, "blobs")
+    os.environ["JOB_WORKER_THREADS"] = "0"
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+
+    import app
+    return app
+
+
+def timed(fn, repeat):
+    """Best wall time of ``repeat`` runs, in milliseconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_listing(args):
+    """Document listing with the blob column loaded (old) vs. metadata only"""
+    A = isolated_app()
+    db, GeneratedDoc, User = A.db, A.GeneratedDoc, A.User
+
+    payload = os.urandom(args.blob_kb * 1024)
+
+    with A.app.app_context():
+        user_id = User.query.filter_by(username="admin").first().id
+        now = datetime.utcnow()
+        for start in range(0, args.rows, 1000):
+            db.session.bulk_insert_mappings(GeneratedDoc, [
+                {
+                    "row_id": i + 1,
+                    "file_name": f"doc_{i}.docx",
+                    "file_data": payload,
+                    "user_id": user_id,
+                    "category": "QMS",
+                    "company": "APL",
+                    "created_at": now,
+                }
+                for i in range(start, min(start + 1000, args.rows))
+            ])
+            db.session.commit()
+
+        def serialize(docs):
+            return [
+                {
+                    "id": d.id,
+                    "row_id": d.row_id,
+                    "file_name": d.file_name,
+                    "category": d.category,
+                    "company": d.company,
+                    "created_at": d.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+                } for d in docs
+            ]
+
+        def full_rows():
+            serialize(
+                GeneratedDoc.query.options(db.undefer(GeneratedDoc.file_data))
+                .filter_by(user_id=user_id)
+                .order_by(GeneratedDoc.created_at.desc())
+                .all()
+            )
+            db.session.expunge_all()
+
+        def metadata_only():
+            serialize(
+                A.document_listing(GeneratedDoc)
+                .filter_by(user_id=user_id)
+                .order_by(GeneratedDoc.created_at.desc())
+                .all()
+            )
+            db.session.expunge_all()
+
+        before = timed(full_rows, args.repeat)
+        after = timed(metadata_only, args.repeat)
+
+    print(f"listing {args.rows} documents of {args.blob_kb} KB")
+    print(f"  with file_data : {before:9.1f} ms")
+    print(f"  metadata only  : {after:9.1f} ms  ({before / after:.1f}x)")
+
+
+def legacy_annotate_json(A, df_master, checklist_certs, generated_rows, generated_checklists):
+    """The per-row apply() pipeline /excel-rows used before annotate_rows()"""
+    df_master = df_master.copy()
+    df_master.reset_index(inplace=True)
+    df_master.rename(columns={"index": "id"}, inplace=True)
+    df_master["id"] = df_master["id"] + 1
+    df_master["Certificate_No"] = df_master["Certificate_No"].astype(str).str.strip().str.upper()
+    df_master["ChecklistAvailable"] = df_master["Certificate_No"].apply(lambda x: x in checklist_certs)
+    df_master["Status"] = df_master["id"].apply(lambda x: "Generated" if x in generated_rows else "Pending")
+    df_master["ChecklistGenerated"] = df_master["id"].apply(lambda x: x in generated_checklists)
+    df_master = df_master.replace({A.np.nan: None, A.np.inf: None, -A.np.inf: None})
+    return A.jsonify(df_master.to_dict(orient="records")).get_data()
+
+
+def synthetic_master(A, rows):
+    import numpy as np
+    import pandas as pd
+
+    columns = {c: [f"{c} {i}" for i in range(rows)] for c in A.CATEGORY_COLUMNS["QMS"]}
+    columns["Certificate_No"] = [f"cert-{i}" for i in range(rows)]
+    columns["Certificate_Issue_Date"] = pd.date_range("2025-01-01", periods=rows, freq="h")
+    columns["MANDAY"] = np.where(np.arange(rows) % 7 == 0, np.nan, 3.0)
+    # Gaps in a text and a date column, as real sheets have
+    columns["Remarks"] = [None if i % 11 == 0 else f"remark {i}" for i in range(rows)]
+    columns["Surveillance_Date"] = pd.Series(pd.date_range("2026-01-01", periods=rows, freq="h")).where(
+        np.arange(rows) % 13 != 0)
+    return pd.DataFrame(columns)
+
+
+def bench_annotate(args):
+    """Status annotation + JSON encoding for /excel-rows: apply() vs. vectorized"""
+    A = isolated_app()
+
+    with A.app.app_context():
+        for rows in (int(n) for n in args.sizes.split(",")):
+            df = synthetic_master(A, rows)
+            checklist_certs = {f"CERT-{i}" for i in range(0, rows, 2)}
+            generated_rows = set(range(1, rows + 1, 3))
+            generated_checklists = set(range(1, rows + 1, 5))
+
+            def legacy():
+                return legacy_annotate_json(A, df, checklist_certs, generated_rows, generated_checklists)
+
+            def vectorized():
+                rows = A.rows_records(A.annotate_rows(df, "QMS", checklist_certs, generated_rows, generated_checklists))
+                return A.jsonify(rows).get_data()
+
+            # Same bytes, not just equal after parsing: float and date formatting included
+            assert legacy() == vectorized(), "outputs differ"
+
+            before = timed(legacy, args.repeat)
+            after = timed(vectorized, args.repeat)
+            print(f"{rows:>7} rows  apply(): {before:9.1f} ms   vectorized: {after:9.1f} ms  ({before / after:.1f}x)")
+
+
+def bench_upload(args):
+    """Upload latency: parsing the whole workbook before replying (old) vs. a header-only check"""
+    A = isolated_app()
+    client = A.app.test_client()
+    token = client.post("/login", json={"username": "admin", "password": "admin123"}).json["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    required = A.CATEGORY_COLUMNS["QMS"]
+
+    for rows in (int(n) for n in args.sizes.split(",")):
+        path = os.path.abspath(f"qms_{rows}.xlsx")
+        synthetic_master(A, rows).to_excel(path, index=False, sheet_name=A.MASTER_SHEET_NAMES["QMS"])
+
+        def full_parse():
+            workbook = A.parse_workbook(path)
+            assert not [c for c in required if c not in workbook.first_sheet().columns]
+            A.write_sidecar(workbook, path)
+
+        def header_only():
+            header = A.read_header(path)
+            assert not [c for c in required if c not in header]
+
+        def upload_request():
+            with open(path, "rb") as f:
+                response = client.post(
+                    "/upload-file",
+                    data={"file": (f, "qms.xlsx"), "category": "QMS", "company": "APL"},
+                    headers=headers,
+                )
+            assert response.status_code == 200, response.json
+
+        before = timed(full_parse, args.repeat)
+        after = timed(header_only, args.repeat)
+        request = timed(upload_request, args.repeat)
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        print(
+            f"{rows:>7} rows ({size_mb:5.1f} MB)  full parse: {before:9.1f} ms   "
+            f"header only: {after:7.1f} ms  ({before / after:.0f}x)   POST /upload-file: {request:7.1f} ms"
+        )
+
+
+def bench_admin(args):
+    """Admin document listing: every ORM row with its user (old) vs. keyset pages of projected columns"""
+    A = isolated_app()
+    db, GeneratedDoc, User = A.db, A.GeneratedDoc, A.User
+
+    with A.app.app_context():
+        user_ids = []
+        for i in range(args.users):
+            user = User(username=f"auditor{i}", role="user")
+            user.set_password("x")
+            db.session.add(user)
+            db.session.flush()
+            user_ids.append(user.id)
+        db.session.commit()
+
+        start_at = datetime(2025, 1, 1)
+        for start in range(0, args.rows, 5000):
+            db.session.bulk_insert_mappings(GeneratedDoc, [
+                {
+                    "row_id": i + 1,
+                    "file_name": f"doc_{i}.docx",
+                    "user_id": user_ids[i % len(user_ids)],
+                    "category": ("QMS", "EMS", "OHSMS")[i % 3],
+                    "company": "APL",
+                    "created_at": start_at + timedelta(seconds=i),
+                }
+                for i in range(start, min(start + 5000, args.rows))
+            ])
+            db.session.commit()
+
+    client = A.app.test_client()
+    token = client.post("/login", json={"username": "admin", "password": "admin123"}).json["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def fetch(**query):
+        response = client.get("/admin/generated-docs", query_string=query, headers=headers)
+        assert response.status_code == 200, response.json
+        return response.json
+
+    def orm_rows():
+        with A.app.app_context():
+            docs = GeneratedDoc.query.options(db.joinedload(GeneratedDoc.user)) \
+                .order_by(GeneratedDoc.created_at.desc()).all()
+            [
+                {
+                    "id": d.id,
+                    "username": d.user.username,
+                    "row_id": d.row_id,
+                    "file_name": d.file_name,
+                    "category": d.category,
+                    "created_at": d.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+                } for d in docs
+            ]
+
+    # A cursor about halfway down the listing
+    with A.app.app_context():
+        middle = GeneratedDoc.query.order_by(GeneratedDoc.created_at.desc()).offset(args.rows // 2).first()
+        cursor = A.encode_cursor(middle.created_at, middle.id)
+
+    timings = [
+        ("all rows, ORM + joined user", timed(orm_rows, args.repeat)),
+        ("all rows, projected", timed(lambda: fetch(), args.repeat)),
+        (f"first page of {args.limit}", timed(lambda: fetch(limit=args.limit), args.repeat)),
+        (f"page of {args.limit} halfway down", timed(lambda: fetch(limit=args.limit, cursor=cursor), args.repeat)),
+        (f"filtered page of {args.limit}",
+         timed(lambda: fetch(limit=args.limit, username="auditor3", category="EMS"), args.repeat)),
+    ]
+
+    print(f"admin listing of {args.rows} documents across {args.users} users")
+    for label, ms in timings:
+        print(f"  {label:<34}: {ms:9.1f} ms")
+
+
+def usable_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def bench_login(args):
+    """/login throughput at each bcrypt cost with concurrent clients, in logins/second per core"""
+    A = isolated_app()
+    cores = min(usable_cores(), A.LOGIN_HASH_WORKERS)
+    print(f"{args.clients} concurrent clients for {args.seconds:g} s per cost; "
+          f"{A.LOGIN_HASH_WORKERS} hashing thread(s) on {usable_cores()} core(s)")
+
+    for rounds in (int(r) for r in args.rounds.split(",")):
+        # Same cost for stored and new hashes, so no login in the run rehashes
+        A.app.config["BCRYPT_LOG_ROUNDS"] = rounds
+        A.bcrypt.init_app(A.app)
+
+        with A.app.app_context():
+            for i in range(args.clients):
+                username = f"auditor{i}"
+                user = A.User.query.filter_by(username=username).first() or A.User(username=username, role="user")
+                user.set_password("secret")
+                A.db.session.add(user)
+            A.db.session.commit()
+            sample = A.User.query.filter_by(username="auditor0").first()
+            verify_ms = timed(lambda: sample.check_password("secret"), 3)
+
+        counts = [0] * args.clients
+        deadline = time.perf_counter() + args.seconds
+
+        def client_loop(i):
+            client = A.app.test_client()
+            while time.perf_counter() < deadline:
+                response = client.post("/login", json={"username": f"auditor{i}", "password": "secret"})
+                assert response.status_code == 200, response.json
+                counts[i] += 1
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=client_loop, args=(i,)) for i in range(args.clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        rate = sum(counts) / (time.perf_counter() - start)
+
+        print(f"  cost {rounds:>2}: {verify_ms:7.1f} ms per check   {rate:7.1f} logins/s   {rate / cores:7.1f} per core")
+
+
+def bench_pool(args):
+    """Connection checkout wait with more threads than pooled connections, per pool size"""
+    A = isolated_app()
+    from sqlalchemy import create_engine, text
+    from db_pool import PoolMetrics, engine_options
+
+    url = os.environ["DATABASE_URL"]
+    hold = args.hold_ms / 1000
+    print(f"{args.threads} threads, each holding a connection {args.hold_ms:g} ms per query, "
+          f"{args.seconds:g} s per pool size")
+
+    for size in (int(s) for s in args.sizes.split(",")):
+        metrics = PoolMetrics()
+        settings = {**A.DB_POOL_SETTINGS, "pool_size": size, "max_overflow": 0}
+        engine = create_engine(url, **engine_options(url, settings, metrics))
+        deadline = time.perf_counter() + args.seconds
+
+        def client_loop():
+            while time.perf_counter() < deadline:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                    # Stands in for the rest of a request that keeps the session open
+                    time.sleep(hold)
+
+        threads = [threading.Thread(target=client_loop) for _ in range(args.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        engine.dispose()
+
+        stats = metrics.stats()
+        print(f"  pool {size:>3}: {stats['checkouts'] / args.seconds:8.1f} queries/s   "
+              f"wait avg {stats['wait_ms_avg']:7.2f} ms   max {stats['wait_ms_max']:7.1f} ms   "
+              f"timeouts {stats['timeouts']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    listing = sub.add_parser("listing", help=bench_listing.__doc__)
+    listing.add_argument("--rows", type=int, default=10000)
+    listing.add_argument("--blob-kb", type=int, default=64)
+    listing.add_argument("--repeat", type=int, default=3)
+    listing.set_defaults(run=bench_listing)
+
+    annotate = sub.add_parser("annotate", help=bench_annotate.__doc__)
+    annotate.add_argument("--sizes", default="1000,10000,100000")
+    annotate.add_argument("--repeat", type=int, default=3)
+    annotate.set_defaults(run=bench_annotate)
+
+    upload = sub.add_parser("upload", help=bench_upload.__doc__)
+    upload.add_argument("--sizes", default="1000,50000")
+    upload.add_argument("--repeat", type=int, default=3)
+    upload.set_defaults(run=bench_upload)
+
+    admin = sub.add_parser("admin", help=bench_admin.__doc__)
+    admin.add_argument("--rows", type=int, default=200000)
+    admin.add_argument("--users", type=int, default=20)
+    admin.add_argument("--limit", type=int, default=100)
+    admin.add_argument("--repeat", type=int, default=3)
+    admin.set_defaults(run=bench_admin)
+
+    login = sub.add_parser("login", help=bench_login.__doc__)
+    login.add_argument("--rounds", default="10,12")
+    login.add_argument("--clients", type=int, default=8)
+    login.add_argument("--seconds", type=float, default=5)
+    login.set_defaults(run=bench_login)
+
+    pool = sub.add_parser("pool", help=bench_pool.__doc__)
+    pool.add_argument("--threads", type=int, default=16)
+    pool.add_argument("--sizes", default="2,8,16")
+    pool.add_argument("--hold-ms", type=float, default=20)
+    pool.add_argument("--seconds", type=float, default=3)
+    pool.set_defaults(run=bench_pool)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Content-addressed storage for generated documents.
+
+A blob is stored once under the SHA-256 of its bytes; the database keeps
+only that hash and the size. ``BLOB_STORE`` selects the backend:
+
+- ``local`` (default): files under ``BLOB_STORE_DIR``
+- ``s3``: any S3-compatible service (``BLOB_S3_BUCKET``, ``BLOB_S3_PREFIX``,
+  ``BLOB_S3_ENDPOINT_URL`` for MinIO or another local stand-in); needs boto3
+"""
+import hashlib
+import os
+import uuid
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class LocalBlobStore:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def put(self, data):
+        """Stores ``data`` unless identical bytes are already there; returns (hash, size)"""
+        key = content_hash(data)
+        path = self.path(key)
+
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        return key, len(data)
+
+    def get(self, key):
+        with open(self.path(key), "rb") as f:
+            return f.read()
+
+    def delete(self, key):
+        path = self.path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def keys(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.endswith(".tmp"):
+                    yield name
+
+
+class S3BlobStore:
+    def __init__(self, bucket, prefix="", endpoint_url=None):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("BLOB_STORE=s3 requires boto3 (pip install boto3)")
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def _object_key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except self.client.exceptions.ClientError:
+            return False
+
+    def put(self, data):
+        key = content_hash(data)
+        if not self.exists(key):
+            self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=data)
+        return key, len(data)
+
+    def get(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))["Body"].read()
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def keys(self):
+        paginator = self.client.get_paginator("list_objects_v2")
+        prefix = f"{self.prefix}/" if self.prefix else ""
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                yield obj["Key"][len(prefix):]
+
+
+def blob_store_from_env():
+    backend = os.getenv("BLOB_STORE", "local").lower()
+
+    if backend == "local":
+        return LocalBlobStore(os.getenv("BLOB_STORE_DIR", "blobs"))
+
+    if backend == "s3":
+        bucket = os.getenv("BLOB_S3_BUCKET")
+        if not bucket:
+            raise RuntimeError("BLOB_STORE=s3 requires BLOB_S3_BUCKET")
+        return S3BlobStore(
+            bucket,
+            prefix=os.getenv("BLOB_S3_PREFIX", ""),
+            endpoint_url=os.getenv("BLOB_S3_ENDPOINT_URL") or None
+        )
+
+    raise RuntimeError(f"Unknown BLOB_STORE: {backend}")
@@ -0,0 +1,90 @@
+"""
+Uploaded files on disk: the chunked upload protocol served by the
+/upload-sessions routes, and the content-addressed names uploads end up under.
+
+A session's bytes collect in "<upload_id>.part" inside the user's upload
+directory, so finalizing is a rename rather than a copy. The part file's
+length is the resume point: a chunk cut off mid-transfer keeps whatever
+arrived, and the client asks for the session and continues from there.
+
+Finished uploads are stored as "<sha256>.<ext>", so the same workbook
+uploaded again lands on the file (and parsed sidecar) already there.
+"""
+import hashlib
+import os
+
+
+COPY_BLOCK_SIZE = 64 * 1024
+
+
+class ChunkTooLarge(Exception):
+    pass
+
+
+def part_path(user_dir, upload_id):
+    return os.path.join(user_dir, f"{upload_id}.part")
+
+
+def received_bytes(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def write_chunk(path, offset, stream, limit):
+    """
+    Copies ``stream`` into ``path`` starting at ``offset`` and returns the
+    number of bytes written. Raises ChunkTooLarge once more than ``limit``
+    bytes have come in; what was written up to then is kept.
+    """
+    written = 0
+    # Writing at the offset (not appending) makes a retried chunk that races
+    # the original write the same bytes to the same place
+    with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+        f.seek(offset)
+        while True:
+            block = stream.read(COPY_BLOCK_SIZE)
+            if not block:
+                break
+            if written + len(block) > limit:
+                raise ChunkTooLarge(f"Chunk exceeds {limit} bytes")
+            f.write(block)
+            written += len(block)
+    return written
+
+
+def save_hashed(stream, path):
+    """Copies ``stream`` to ``path``, hashing it on the way; returns the SHA-256"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "wb") as f:
+            for block in iter(lambda: stream.read(COPY_BLOCK_SIZE), b""):
+                digest.update(block)
+                f.write(block)
+    except BaseException:
+        os.remove(path)
+        raise
+    return digest.hexdigest()
+
+
+def content_path(user_dir, digest, file_name):
+    ext = file_name.lower().split(".")[-1]
+    return os.path.join(user_dir, f"{digest}.{ext}")
+
+
+def store_part(part, path):
+    """
+    Moves a fully received part file to its content path. Returns False
+    (and drops the part) when that content is already stored there.
+    """
+    if os.path.exists(path):
+        os.remove(part)
+        return False
+    os.replace(part, path)
+    return True
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(COPY_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
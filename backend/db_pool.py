@@ -0,0 +1,113 @@
+"""
+Connection pool settings for the SQLAlchemy engine, and what the pool is
+doing right now.
+
+    DB_POOL_SIZE=5            connections kept open per process
+    DB_POOL_MAX_OVERFLOW=10   extra connections opened under load, closed when returned
+    DB_POOL_TIMEOUT=30        seconds a request waits for a connection before failing
+    DB_POOL_RECYCLE=1800      seconds after which a connection is replaced
+    DB_POOL_PRE_PING=1        test each connection as it is checked out
+
+Every gunicorn worker process has its own pool, shared by its threads
+(including the in-process job workers). Give each process at least
+pool size + overflow >= threads, and keep processes x (pool size + overflow)
+under the server's max_connections. A rising wait time or any timeouts in
+the stats mean threads are queueing for connections.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+
+def pool_settings():
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_POOL_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "1") == "1",
+    }
+
+
+def is_memory_database(database_url):
+    return database_url.startswith("sqlite") and (
+        database_url in ("sqlite://", "sqlite:///") or ":memory:" in database_url or "mode=memory" in database_url
+    )
+
+
+def engine_options(database_url, settings, metrics):
+    """SQLALCHEMY_ENGINE_OPTIONS for ``database_url``"""
+    # An in-memory SQLite database lives in a single connection; keep its own pool
+    if not database_url or is_memory_database(database_url):
+        return {}
+    return {"poolclass": instrumented_pool_class(metrics), **settings}
+
+
+class PoolMetrics:
+    """Checkout counts and waits, across every pool created with instrumented_pool_class()"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.invalidated = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record_checkout(self, waited):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_invalidated(self):
+        with self._lock:
+            self.invalidated += 1
+
+    def stats(self, pool=None):
+        with self._lock:
+            stats = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "invalidated": self.invalidated,
+                "wait_ms_total": round(self.wait_seconds * 1000, 1),
+                "wait_ms_avg": round(self.wait_seconds * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_ms_max": round(self.max_wait_seconds * 1000, 1),
+            }
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                # overflow() starts at -size while the pool is still filling up
+                "overflow": max(pool.overflow(), 0),
+            })
+        return stats
+
+
+def instrumented_pool_class(metrics):
+    """A QueuePool that reports into ``metrics``; recreated pools keep the class"""
+
+    class InstrumentedQueuePool(QueuePool):
+        def connect(self):
+            # Time until the caller has a usable connection: queueing for a
+            # free one, opening an overflow one and the pre-ping all count
+            start = time.perf_counter()
+            try:
+                connection = super().connect()
+            except exc.TimeoutError:
+                metrics.record_timeout()
+                raise
+            metrics.record_checkout(time.perf_counter() - start)
+            return connection
+
+    # Connections found dead (by pre-ping or a failed statement) are thrown away
+    event.listen(InstrumentedQueuePool, "invalidate", lambda *args: metrics.record_invalidated())
+    return InstrumentedQueuePool
@@ -0,0 +1,120 @@
+"""
+Server-side paging, sorting and filtering of a DataFrame from query-string
+arguments, for table endpoints such as /excel-rows.
+
+    page=2&page_size=50        1-based page; page_size is capped at MAX_PAGE_SIZE
+    sort=-Status,Organization_Name
+                               comma-separated columns, "-" for descending
+    q=acme                     case-insensitive substring match on any column
+    <Column>=value             exact, case-insensitive match on that column;
+                               several values may be given comma-separated
+"""
+import os
+
+import pandas as pd
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+
+RESERVED_PARAMS = {"page", "page_size", "sort", "q"}
+
+
+class QueryError(ValueError):
+    """Invalid paging/sorting/filter argument; reported to the client as 400"""
+
+
+def _positive_int(args, name, default):
+    raw = args.get(name)
+    if raw in (None, ""):
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise QueryError(f"{name} must be an integer")
+    if value < 1:
+        raise QueryError(f"{name} must be at least 1")
+    return value
+
+
+def wants_page(args):
+    """Paged envelope responses are opt-in so existing clients keep getting arrays"""
+    return "page" in args or "page_size" in args
+
+
+def _as_text(series):
+    return series.astype(str).str.strip().str.lower()
+
+
+def filter_frame(df, args):
+    """Applies column filters and the ``q`` search; unknown parameters are ignored"""
+    mask = pd.Series(True, index=df.index)
+
+    for name in args:
+        if name in RESERVED_PARAMS or name not in df.columns:
+            continue
+        wanted = {v.strip().lower() for v in args.get(name).split(",")}
+        mask &= _as_text(df[name]).isin(wanted)
+
+    q = (args.get("q") or "").strip().lower()
+    if q:
+        hits = pd.Series(False, index=df.index)
+        for column in df.columns:
+            hits |= _as_text(df[column]).str.contains(q, regex=False)
+        mask &= hits
+
+    return df[mask]
+
+
+def sort_frame(df, sort):
+    if not sort:
+        return df
+
+    columns, ascending = [], []
+    for part in sort.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        descending = part.startswith("-")
+        column = part.lstrip("+-")
+        if column not in df.columns:
+            raise QueryError(f"Cannot sort by unknown column: {column}")
+        columns.append(column)
+        ascending.append(not descending)
+
+    if not columns:
+        return df
+
+    # Mixed-type Excel columns cannot be compared directly; sort those as text
+    def key(series):
+        if series.dtype == object:
+            return series.astype(str).str.lower()
+        return series
+
+    return df.sort_values(columns, ascending=ascending, kind="stable", key=key, na_position="last")
+
+
+def query_frame(df, args):
+    """
+    Filters, sorts and (when asked) pages ``df``.
+
+    Returns ``(frame, meta)``; ``meta`` is None unless paging was requested,
+    otherwise it holds total/page/page_size/pages for the response envelope.
+    """
+    df = sort_frame(filter_frame(df, args), args.get("sort"))
+
+    if not wants_page(args):
+        return df, None
+
+    page = _positive_int(args, "page", 1)
+    page_size = min(_positive_int(args, "page_size", DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+    total = len(df)
+    start = (page - 1) * page_size
+
+    meta = {
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "pages": (total + page_size - 1) // page_size,
+    }
+    return df.iloc[start:start + page_size], meta
@@ -0,0 +1,13 @@
+"""
+gunicorn settings read from the working directory:
+
+    gunicorn app:app                         # web workers that also run generation jobs
+    JOB_WORKER_THREADS=0 gunicorn app:app    # or: web only, with python worker.py
+"""
+
+
+def post_worker_init(worker):
+    # Job worker threads are started in each forked worker, so they also run
+    # under --preload, where the app was imported before the fork
+    from app import start_job_workers
+    start_job_workers()
@@ -0,0 +1,227 @@
+"""
+Database-backed queue for document generation.
+
+Jobs are rows in ``generation_jobs``; any process that can reach the
+database can run them, either through the worker threads started inside
+the web process or through ``python worker.py``. Workers claim a job with a
+conditional UPDATE, so two workers never run the same job.
+"""
+import json
+import os
+import socket
+import threading
+import traceback
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from models import db, GenerationJob
+
+
+JOB_HANDLERS = {}
+
+# A running job whose heartbeat is older than this is assumed to belong to a
+# dead worker and is picked up again
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "600"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+# How often a running job's heartbeat is refreshed, however long one step takes
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", str(max(1, JOB_STALE_SECONDS / 4))))
+
+
+def job_handler(kind):
+    """Registers ``fn(job, params)`` as the handler for a job kind"""
+    def decorator(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def enqueue_job(user_id, kind, params, total=1):
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    job = GenerationJob(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        kind=kind,
+        params=json.dumps(params),
+        total=total,
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def job_to_dict(job):
+    def fmt(value):
+        return value.strftime("%Y-%m-%d %H:%M:%S") if value else None
+
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "total": job.total,
+        "completed": job.completed,
+        "failed": job.failed,
+        "results": json.loads(job.results or "[]"),
+        "error": job.error,
+        "created_at": fmt(job.created_at),
+        "started_at": fmt(job.started_at),
+        "finished_at": fmt(job.finished_at),
+    }
+
+
+def report_progress(job, result):
+    """Records the outcome of one document of a job and commits it"""
+    results = json.loads(job.results or "[]")
+    results.append(result)
+    job.results = json.dumps(results)
+
+    if "error" in result:
+        job.failed = (job.failed or 0) + 1
+    else:
+        job.completed = (job.completed or 0) + 1
+
+    job.heartbeat_at = datetime.utcnow()
+    db.session.commit()
+
+
+def finished_row_ids(job):
+    """Rows of a job that already have their document"""
+    return {r["row_id"] for r in json.loads(job.results or "[]") if "error" not in r and "row_id" in r}
+
+
+def resume_progress(job):
+    """
+    Progress of a job taken over from a dead worker: documents it stored
+    are kept (handlers skip their rows), failures are dropped to be retried.
+    """
+    results = [r for r in json.loads(job.results or "[]") if "error" not in r]
+    job.results = json.dumps(results)
+    job.completed = len(results)
+    job.failed = 0
+    job.error = None
+    db.session.commit()
+
+
+def claim_next_job(worker_name):
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=JOB_STALE_SECONDS)
+
+    candidate = GenerationJob.query.filter(
+        db.or_(
+            GenerationJob.status == "queued",
+            db.and_(
+                GenerationJob.status == "running",
+                GenerationJob.heartbeat_at < stale_before
+            )
+        )
+    ).order_by(GenerationJob.created_at).first()
+
+    if not candidate:
+        db.session.rollback()
+        return None
+
+    claimed = GenerationJob.query.filter(
+        GenerationJob.id == candidate.id,
+        GenerationJob.status == candidate.status,
+        GenerationJob.heartbeat_at.is_(None) if candidate.heartbeat_at is None
+        else GenerationJob.heartbeat_at == candidate.heartbeat_at
+    ).update({
+        "status": "running",
+        "worker": worker_name,
+        "started_at": now,
+        "heartbeat_at": now,
+    }, synchronize_session=False)
+    db.session.commit()
+
+    if claimed != 1:
+        return None
+
+    job = db.session.get(GenerationJob, candidate.id, populate_existing=True)
+    if candidate.status == "running":
+        resume_progress(job)
+    return job
+
+
+@contextmanager
+def heartbeat(job):
+    """Refreshes the job's heartbeat from a background thread while the block runs"""
+    app = current_app._get_current_object()
+    job_id, worker = job.id, job.worker
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(JOB_HEARTBEAT_SECONDS):
+            try:
+                with app.app_context():
+                    # Its own connection, so a long handler transaction does not hold it back;
+                    # a job some other worker has taken over is left alone
+                    with db.engine.begin() as conn:
+                        conn.execute(
+                            db.update(GenerationJob)
+                            .where(GenerationJob.id == job_id, GenerationJob.worker == worker)
+                            .values(heartbeat_at=datetime.utcnow())
+                        )
+            except Exception:
+                traceback.print_exc()
+
+    thread = threading.Thread(target=beat, name=f"job-heartbeat-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job):
+    handler = JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise ValueError(f"Unknown job kind: {job.kind}")
+        # A job taken over after its last document was stored has nothing left to do
+        if job.completed < job.total:
+            with heartbeat(job):
+                handler(job, json.loads(job.params or "{}"))
+        job.status = "finished"
+    except Exception as e:
+        db.session.rollback()
+        traceback.print_exc()
+        job.status = "failed"
+        job.error = str(e)
+
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def run_worker(app, stop_event=None, poll_interval=JOB_POLL_INTERVAL):
+    """Claims and runs jobs until ``stop_event`` is set"""
+    worker_name = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    stop_event = stop_event or threading.Event()
+
+    while not stop_event.is_set():
+        try:
+            with app.app_context():
+                job = claim_next_job(worker_name)
+                if job is not None:
+                    run_job(job)
+                    continue
+        except Exception:
+            traceback.print_exc()
+
+        stop_event.wait(poll_interval)
+
+
+def start_worker_threads(app, count):
+    stop_event = threading.Event()
+    for i in range(count):
+        threading.Thread(
+            target=run_worker,
+            args=(app, stop_event),
+            name=f"job-worker-{i}",
+            daemon=True
+        ).start()
+    return stop_event
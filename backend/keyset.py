@@ -0,0 +1,88 @@
+"""
+Keyset ("seek") pagination for listings ordered newest first by a
+timestamp column with the primary key as tie-breaker.
+
+    limit=100          page size, capped at MAX_PAGE_SIZE
+    cursor=<token>     "next_cursor" of the previous page
+
+Each page is a range scan on a (timestamp, id) index that starts where the
+previous one stopped, so page 1000 costs the same as page 1, and rows added
+while a client pages through do not shift later pages the way OFFSET does.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+from frame_query import MAX_PAGE_SIZE, QueryError
+
+
+DEFAULT_LIMIT = 100
+
+
+def wants_keyset(args):
+    """Paged envelope responses are opt-in so existing clients keep getting everything"""
+    return "limit" in args or "cursor" in args
+
+
+def encode_cursor(timestamp, row_id):
+    raw = f"{timestamp.isoformat()}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(token):
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, UnicodeError, binascii.Error):
+        raise QueryError("Invalid cursor")
+
+
+def page_limit(args):
+    raw = args.get("limit")
+    if raw in (None, ""):
+        return DEFAULT_LIMIT
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise QueryError("limit must be an integer")
+    if limit < 1:
+        raise QueryError("limit must be at least 1")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def keyset_query(query, timestamp_column, id_column, args):
+    """
+    ``query`` ordered newest first and, when paging was asked for, narrowed
+    to the page after ``cursor`` (plus one row, to tell if another follows).
+    """
+    query = query.order_by(timestamp_column.desc(), id_column.desc())
+
+    if not wants_keyset(args):
+        return query
+
+    if args.get("cursor"):
+        timestamp, row_id = decode_cursor(args["cursor"])
+        query = query.filter(tuple_(timestamp_column, id_column) < (timestamp, row_id))
+    return query.limit(page_limit(args) + 1)
+
+
+def keyset_page(query, timestamp_column, id_column, args):
+    """
+    Runs keyset_query() and returns ``(rows, next_cursor)``; ``next_cursor``
+    is None on the last page (and when not paging). Rows must expose the
+    timestamp and id under the columns' names.
+    """
+    rows = keyset_query(query, timestamp_column, id_column, args).all()
+
+    if not wants_keyset(args):
+        return rows, None
+
+    limit = page_limit(args)
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, timestamp_column.key), getattr(last, id_column.key))
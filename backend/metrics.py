@@ -0,0 +1,222 @@
+"""
+Where the time of a request goes: per-phase durations and byte counts for
+the generation, upload and row endpoints, served in the Prometheus text
+format and optionally logged as one JSON line per request.
+
+A view decorated with ``instrumented("generate_docx")`` opens a trace; code
+it calls marks its phases with ``with phase("render") as p: ... p.nbytes = n``.
+Outside a traced request (e.g. in a job worker) ``phase`` records nothing,
+so the shared generation code can be marked up unconditionally.
+
+The "send" phase runs from the view returning until the server has written
+the whole body, so a slow client shows up there and not in the view.
+
+Figures are per process: with several gunicorn workers, scrape each one
+(or compare the per-worker series).
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from flask import make_response
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_current_trace = ContextVar("current_trace", default=None)
+
+
+class Phase:
+    __slots__ = ("name", "seconds", "nbytes")
+
+    def __init__(self, name, nbytes=None):
+        self.name = name
+        self.seconds = 0.0
+        self.nbytes = nbytes
+
+
+class Trace:
+    """The phases of one request, in the order they finished"""
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.phases = []
+        self.started = time.perf_counter()
+
+    def totals(self):
+        """``{phase: (seconds, bytes or None)}``, repeated phases added up"""
+        totals = {}
+        for p in self.phases:
+            seconds, nbytes = totals.get(p.name, (0.0, None))
+            if p.nbytes is not None:
+                nbytes = (nbytes or 0) + p.nbytes
+            totals[p.name] = (seconds + p.seconds, nbytes)
+        return totals
+
+    def summary(self):
+        """``{phase: {"ms": ..., "bytes": ...}}``, repeated phases added up"""
+        summary = {}
+        for name, (seconds, nbytes) in self.totals().items():
+            summary[name] = {"ms": round(seconds * 1000, 2)}
+            if nbytes is not None:
+                summary[name]["bytes"] = nbytes
+        return summary
+
+
+@contextmanager
+def phase(name, nbytes=None):
+    """Times the block as ``name`` in the current request's trace, if there is one"""
+    record = Phase(name, nbytes)
+    trace = _current_trace.get()
+    if trace is None:
+        yield record
+        return
+
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.seconds = time.perf_counter() - start
+        trace.phases.append(record)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound:g}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f"{name}_sum{{{labels}}} {self.sum:.6f}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+def _labels(**labels):
+    return ",".join(f'{k}="{v}"' for k, v in labels.items())
+
+
+class RequestMetrics:
+    """Process-wide totals of every finished trace"""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._requests = {}       # (operation, status) -> Histogram
+        self._phases = {}         # (operation, phase) -> Histogram
+        self._phase_bytes = {}    # (operation, phase) -> bytes
+
+    def record(self, trace, status, seconds):
+        # One observation per phase per request, so a phase's count matches
+        # the request count however many times the view entered it
+        totals = trace.totals()
+        with self._lock:
+            key = (trace.operation, status)
+            self._requests.setdefault(key, Histogram(self.buckets)).observe(seconds)
+            for name, (phase_seconds, nbytes) in totals.items():
+                key = (trace.operation, name)
+                self._phases.setdefault(key, Histogram(self.buckets)).observe(phase_seconds)
+                if nbytes is not None:
+                    self._phase_bytes[key] = self._phase_bytes.get(key, 0) + nbytes
+
+    def prometheus(self):
+        lines = [
+            "# HELP kvqa_request_seconds Time from the view starting to the response body being sent",
+            "# TYPE kvqa_request_seconds histogram",
+        ]
+        with self._lock:
+            for (operation, status), histogram in sorted(self._requests.items()):
+                lines.extend(histogram.lines("kvqa_request_seconds", _labels(operation=operation, status=status)))
+
+            lines += [
+                "# HELP kvqa_phase_seconds Time each request spent in a phase, repeats of it added up",
+                "# TYPE kvqa_phase_seconds histogram",
+            ]
+            for (operation, name), histogram in sorted(self._phases.items()):
+                lines.extend(histogram.lines("kvqa_phase_seconds", _labels(operation=operation, phase=name)))
+
+            lines += [
+                "# HELP kvqa_phase_bytes_total Bytes read, produced or written by each phase",
+                "# TYPE kvqa_phase_bytes_total counter",
+            ]
+            for (operation, name), total in sorted(self._phase_bytes.items()):
+                lines.append(f"kvqa_phase_bytes_total{{{_labels(operation=operation, phase=name)}}} {total}")
+        return "\n".join(lines) + "\n"
+
+
+def stats_gauges(prefix, stats):
+    """Prometheus lines for the numeric values of a cache's stats() dict"""
+    lines = []
+    for key, value in stats.items():
+        if isinstance(value, bool):
+            value = int(value)
+        if not isinstance(value, (int, float)):
+            continue
+        name = f"kvqa_{prefix}_{key}"
+        lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+def instrumented(operation, metrics, log_requests=False):
+    """
+    Traces a Flask view as ``operation``. The trace is recorded in
+    ``metrics`` (and logged, when ``log_requests``) once the response has
+    been sent.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            trace = Trace(operation)
+            token = _current_trace.set(trace)
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                metrics.record(trace, 500, time.perf_counter() - trace.started)
+                raise
+            finally:
+                _current_trace.reset(token)
+
+            # Werkzeug hands a passthrough body (send_file) to the server
+            # without its close callbacks; these views only send in-memory
+            # bytes, which are iterated either way
+            response.direct_passthrough = False
+
+            send = Phase("send", response.content_length)
+            send_started = time.perf_counter()
+
+            def finish():
+                end = time.perf_counter()
+                send.seconds = end - send_started
+                trace.phases.append(send)
+                metrics.record(trace, response.status_code, end - trace.started)
+                if log_requests:
+                    print(json.dumps({
+                        "event": "request",
+                        "operation": operation,
+                        "status": response.status_code,
+                        "ms": round((end - trace.started) * 1000, 2),
+                        "phases": trace.summary(),
+                    }), flush=True)
+
+            response.call_on_close(finish)
+            return response
+        return wrapper
+    return decorator
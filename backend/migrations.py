@@ -0,0 +1,172 @@
+"""
+In-place schema upgrades for databases created before a column existed.
+
+``db.create_all()`` only creates missing tables, so every later addition
+to an existing table is listed here. Indexes declared on the models are
+created when missing. Each step checks the live schema first.
+
+This is DDL, so it runs once per deploy, before the new code starts:
+
+    flask upgrade-schema
+
+On Postgres, concurrent runs wait for each other on an advisory lock and
+indexes are built CONCURRENTLY, so writes to large tables are not blocked.
+"""
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+from models import db
+
+
+# table -> [(column, DDL type)]
+ADDED_COLUMNS = {
+    "user_files": [
+        ("content_hash", "VARCHAR(64)"),
+        ("blob_hash", "VARCHAR(64)"),
+    ],
+    "generated_doc": [
+        ("blob_hash", "VARCHAR(64)"),
+        ("blob_size", "INTEGER"),
+    ],
+    "checklist_docs": [
+        ("blob_hash", "VARCHAR(64)"),
+        ("blob_size", "INTEGER"),
+    ],
+}
+
+# Tables whose category / company are stored normalized (see models.NormalizedScope)
+NORMALIZED_SCOPE_TABLES = ["user_files", "generated_doc", "checklist_docs"]
+
+# Columns that used to be NOT NULL
+RELAXED_COLUMNS = {
+    "generated_doc": ["file_data"],
+    "checklist_docs": ["file_data"],
+}
+
+# pg_advisory_lock key held while upgrading
+UPGRADE_LOCK_KEY = 0x6B767161
+
+
+class SchemaUpgradeError(Exception):
+    pass
+
+
+def upgrade_schema():
+    engine = db.engine
+    postgres = engine.dialect.name == "postgresql"
+
+    with engine.connect() as lock:
+        if postgres:
+            lock.execute(text("SELECT pg_advisory_lock(:key)"), {"key": UPGRADE_LOCK_KEY})
+            lock.commit()
+        try:
+            # Inspected only once the lock is held, so a second run sees the first one's work
+            tables = set(inspect(engine).get_table_names())
+            upgrade_tables(engine, tables)
+            run_data_migrations(engine, tables)
+            create_missing_indexes(engine, tables)
+        finally:
+            if postgres:
+                lock.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": UPGRADE_LOCK_KEY})
+                lock.commit()
+
+
+def upgrade_tables(engine, tables):
+    inspector = inspect(engine)
+
+    with engine.begin() as conn:
+        for table, columns in RELAXED_COLUMNS.items():
+            if table not in tables:
+                continue
+            nullable = {c["name"]: c["nullable"] for c in inspector.get_columns(table)}
+            for name in columns:
+                if nullable.get(name) is not False:
+                    continue
+                if engine.dialect.name != "postgresql":
+                    # Every insert that leaves the column empty would fail, so stop before changing anything
+                    raise SchemaUpgradeError(
+                        f"{table}.{name} is NOT NULL and {engine.dialect.name} cannot relax it in place; "
+                        f"recreate the table with the column nullable, then run this again"
+                    )
+                conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {name} DROP NOT NULL"))
+                print(f"🛠️ {table}.{name} is now nullable")
+
+        for table, columns in ADDED_COLUMNS.items():
+            if table not in tables:
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table)}
+            for name, ddl_type in columns:
+                if name not in existing:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl_type}"))
+                    print(f"🛠️ Added {table}.{name}")
+
+
+def normalize_scopes(conn, tables):
+    """Rows written before category / company were normalized on save"""
+    for table in NORMALIZED_SCOPE_TABLES:
+        if table not in tables:
+            continue
+        result = conn.execute(text(
+            f"UPDATE {table} SET category = UPPER(TRIM(category)), company = UPPER(TRIM(company)) "
+            f"WHERE category <> UPPER(TRIM(category)) OR company <> UPPER(TRIM(company))"
+        ))
+        if result.rowcount:
+            print(f"🛠️ Normalized category/company on {result.rowcount} {table} row(s)")
+
+
+# One-off data fixes: each runs in the first upgrade that knows it and is
+# recorded in schema_migrations, so later deploys do not scan the tables again
+DATA_MIGRATIONS = [
+    ("normalize_scopes", normalize_scopes),
+]
+
+
+def run_data_migrations(engine, tables):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations "
+            "(name VARCHAR(100) PRIMARY KEY, applied_at TIMESTAMP NOT NULL)"
+        ))
+        applied = set(conn.execute(text("SELECT name FROM schema_migrations")).scalars())
+
+        for name, migrate in DATA_MIGRATIONS:
+            if name in applied:
+                continue
+            migrate(conn, tables)
+            conn.execute(
+                text("INSERT INTO schema_migrations (name, applied_at) VALUES (:name, :now)"),
+                {"name": name, "now": datetime.utcnow()}
+            )
+            print(f"🛠️ Applied data migration {name}")
+
+
+def create_missing_indexes(engine, tables):
+    """Indexes declared on the models but missing from tables that already existed"""
+    inspector = inspect(engine)
+    postgres = engine.dialect.name == "postgresql"
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            existing = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+
+                ddl = str(CreateIndex(index).compile(dialect=engine.dialect))
+                if not postgres:
+                    conn.execute(text(ddl))
+                    print(f"🛠️ Created index {index.name}")
+                    continue
+
+                try:
+                    conn.execute(text(ddl.replace("INDEX", "INDEX CONCURRENTLY", 1)))
+                except Exception:
+                    # A failed concurrent build leaves an invalid index behind under the same name
+                    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"))
+                    raise
+                print(f"🛠️ Created index {index.name}")
@@ -5,6 +5,19 @@ from datetime import datetime
 db = SQLAlchemy()
 bcrypt = Bcrypt()
 
+
+def normalize_code(value):
+    """Category / company codes are stored trimmed and upper-cased ("qms " -> "QMS")"""
+    return value.strip().upper() if isinstance(value, str) else value
+
+
+class NormalizedScope:
+    """Normalizes category and company on every write, so filters can use plain equality"""
+
+    @db.validates("category", "company")
+    def _normalize_scope(self, key, value):
+        return normalize_code(value)
+
 class User(db.Model):
     __tablename__ = "users"
 
@@ -13,15 +26,30 @@ class User(db.Model):
     password = db.Column(db.String(200), nullable=False)
     role = db.Column(db.String(20), default="user")
 
+    @staticmethod
+    def hash_password(raw_password):
+        """bcrypt hash at the configured cost (BCRYPT_LOG_ROUNDS)"""
+        return bcrypt.generate_password_hash(raw_password).decode("utf-8")
+
     def set_password(self, raw_password):
         """Hash and set password"""
-        self.password = bcrypt.generate_password_hash(raw_password).decode("utf-8")
+        self.password = self.hash_password(raw_password)
 
     def check_password(self, raw_password):
         """Verify password"""
         return bcrypt.check_password_hash(self.password, raw_password)
 
-class UserFile(db.Model):
+    def password_rounds(self):
+        """Cost the stored hash was made with ("$2b$12$..." -> 12), or None if unreadable"""
+        try:
+            return int(self.password.split("$")[2])
+        except (IndexError, ValueError):
+            return None
+
+    def needs_rehash(self, rounds):
+        return self.password_rounds() != rounds
+
+class UserFile(NormalizedScope, db.Model):
     __tablename__ = "user_files"
 
     id = db.Column(db.Integer, primary_key=True)
@@ -32,16 +60,31 @@ class UserFile(db.Model):
     source_type = db.Column(db.String(20), default="uploaded")
     category = db.Column(db.String(50), nullable=False)
     company = db.Column(db.String(50), nullable=False)
+    # SHA-256 of the uploaded bytes; None for files uploaded before it was recorded
+    content_hash = db.Column(db.String(64), nullable=True)
+    # Generated documents: blob store key of the DOCX; None for uploads
+    blob_hash = db.Column(db.String(64), nullable=True)
 
 
     user = db.relationship("User", backref="files")
 
+    __table_args__ = (
+        db.Index("ix_user_files_user_source", "user_id", "source_type"),
+        db.Index("ix_user_files_user_content_hash", "user_id", "content_hash", "category", "company"),
+        # Admin listing: newest first, paged by (uploaded_at, id)
+        db.Index("ix_user_files_uploaded", "uploaded_at", "id"),
+    )
+
 
-class GeneratedDoc(db.Model):
+class GeneratedDoc(NormalizedScope, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     row_id = db.Column(db.Integer, nullable=False)
     file_name = db.Column(db.String(255), nullable=False)
-    file_data = db.Column(db.LargeBinary, nullable=False)
+    # Legacy inline copy; new documents live in the blob store (see blobstore.py).
+    # Deferred so listings never pull it; only loaded when accessed.
+    file_data = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    blob_hash = db.Column(db.String(64), nullable=True)
+    blob_size = db.Column(db.Integer, nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     category = db.Column(db.String(50), nullable=False)
     company = db.Column(db.String(50), nullable=False)
@@ -49,13 +92,26 @@ class GeneratedDoc(db.Model):
 
     user = db.relationship("User", backref="generated_docs")
 
-class ChecklistDoc(db.Model):
+    # No unique key on (user_id, company, category, row_id): row_id is a row
+    # number within one upload, and regenerations are kept as history.
+    __table_args__ = (
+        db.Index("ix_generated_doc_scope_row", "user_id", "category", "company", "row_id"),
+        db.Index("ix_generated_doc_user_file_name", "user_id", "file_name"),
+        # Admin listings: newest first, paged by (created_at, id)
+        db.Index("ix_generated_doc_created", "created_at", "id"),
+    )
+
+class ChecklistDoc(NormalizedScope, db.Model):
     __tablename__ = "checklist_docs"
 
     id = db.Column(db.Integer, primary_key=True)
     row_id = db.Column(db.Integer, nullable=False)
     file_name = db.Column(db.String(255), nullable=False)
-    file_data = db.Column(db.LargeBinary, nullable=False)
+    # Legacy inline copy; new documents live in the blob store (see blobstore.py).
+    # Deferred so listings never pull it; only loaded when accessed.
+    file_data = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    blob_hash = db.Column(db.String(64), nullable=True)
+    blob_size = db.Column(db.Integer, nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     category = db.Column(db.String(50), nullable=False)
     company = db.Column(db.String(50), nullable=False)
@@ -63,3 +119,46 @@ class ChecklistDoc(db.Model):
 
     user = db.relationship("User", backref="checklist_docs")
 
+    __table_args__ = (
+        db.Index("ix_checklist_docs_scope_row", "user_id", "category", "company", "row_id"),
+        db.Index("ix_checklist_docs_user_file_name", "user_id", "file_name"),
+    )
+
+
+class GenerationJob(db.Model):
+    __tablename__ = "generation_jobs"
+
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    kind = db.Column(db.String(30), nullable=False)
+    params = db.Column(db.Text, nullable=False, default="{}")
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    total = db.Column(db.Integer, nullable=False, default=1)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    results = db.Column(db.Text, nullable=False, default="[]")
+    error = db.Column(db.Text, nullable=True)
+    worker = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    user = db.relationship("User", backref="generation_jobs")
+
+
+class UploadSession(NormalizedScope, db.Model):
+    """A chunked upload in progress; its bytes collect in a part file until finalized"""
+    __tablename__ = "upload_sessions"
+
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    file_name = db.Column(db.String(255), nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    company = db.Column(db.String(50), nullable=False)
+    # Declared by the client at init; chunks past it are refused
+    total_size = db.Column(db.BigInteger, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    user = db.relationship("User", backref="upload_sessions")
@@ -0,0 +1,76 @@
+"""
+Rendered DOCX documents keyed by what went into them.
+
+A key is the SHA-256 of the template's content hash, the remote template's
+content hash (if any), the kind of render and the row context, so a row
+that is regenerated with unchanged data and template is served without
+running docxtpl again. Editing the template changes its hash, which makes
+old entries unreachable; they age out of the LRU.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+
+def render_key(kind, template_digest, remote_digest, context):
+    payload = json.dumps(
+        [kind, template_digest, remote_digest, context],
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """Process-wide LRU of rendered documents, bounded by total bytes and entry count"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entries=256):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        size = len(data)
+        with self._lock:
+            if key in self._entries or size > self.max_bytes:
+                return
+            self._entries[key] = data
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
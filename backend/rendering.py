@@ -0,0 +1,152 @@
+"""
+DOCX rendering helpers that need neither Flask nor the database, so the
+bulk generation worker processes can import them on their own.
+"""
+import io
+import os
+import re
+from datetime import datetime
+
+import pandas as pd
+from docxtpl import DocxTemplate
+
+from template_registry import TemplateRegistry
+
+
+DOCX_MIMETYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+def docx_context(row):
+    """Row values as the certificate templates expect them"""
+    context = {}
+    for k, v in row.items():
+        if isinstance(v, (pd.Timestamp, datetime)):
+            context[k] = v.strftime("%d-%m-%Y")
+        elif isinstance(v, str):
+            context[k] = (
+                v.replace("&", "&amp;")
+                .replace("<", "&lt;")
+                .replace(">", "&gt;")
+            )
+        elif pd.isna(v):
+            context[k] = ""
+        else:
+            context[k] = v
+    return context
+
+
+def docx_file_name(context, category, fallback):
+    org_name = context.get("Organization_Name", fallback)
+    org_name_safe = re.sub(r'[^\w]', '_', org_name).strip("_")
+    return f"{org_name_safe}-{category.lower()}.docx"
+
+
+def checklist_context(master_data, checklist_data):
+    """Master row merged with its checklist row, as the checklist templates expect"""
+    context = {**master_data, **checklist_data}
+
+    for k, v in context.items():
+        if isinstance(v, (pd.Timestamp, datetime)):
+            context[k] = v.strftime("%d-%m-%Y")
+        elif pd.isna(v) or str(v).strip().lower() == "null":
+            context[k] = "NA"
+        elif isinstance(v, str):
+            context[k] = v.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+    return context
+
+
+def checklist_file_name(context, category, fallback):
+    org_name = context.get("Organization_Name", fallback)
+    org_name_safe = re.sub(r"[^\w]", "_", org_name).strip("_")
+    return f"{org_name_safe}_{category}_checklist.docx"
+
+
+def isms_context(field_names, values):
+    """One column of a vertical ISMS sheet keyed by its field names"""
+    clean_data = {}
+    for key, val in zip(field_names, values):
+        key_safe = re.sub(r"[^\w]", "_", key)
+        if isinstance(val, (pd.Timestamp, datetime)):
+            clean_data[key_safe] = val.strftime("%d-%m-%Y")
+        elif pd.isna(val):
+            clean_data[key_safe] = ""
+        else:
+            clean_data[key_safe] = str(val)
+    return clean_data
+
+
+def isms_file_name(context, col_id):
+    org_name = context.get("Organization_Name", f"ISMS_Record_{col_id}")
+    safe_org = re.sub(r"[^\w]", "_", org_name)
+    return f"{safe_org}.docx"
+
+
+def _render(doc, context):
+    doc.render(context)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def _as_template(template):
+    return template if isinstance(template, DocxTemplate) else DocxTemplate(template)
+
+
+def render_template(template, context):
+    """Renders a template (DocxTemplate, path or file-like) and returns the DOCX bytes"""
+    return _render(_as_template(template), context)
+
+
+def render_docx(template, context, remote_template=None):
+    """
+    Renders a certificate and returns the DOCX bytes.
+
+    ``template`` is a DocxTemplate, path or file-like object and
+    ``remote_template`` a path or file-like object; the remote section is
+    only filled in when a remote template is given.
+    """
+    doc = _as_template(template)
+    context = dict(context)
+
+    # 🔹 Handle remote section
+    if remote_template is not None:
+        context["remote_section"] = doc.new_subdoc(remote_template)
+    else:
+        context["remote_section"] = ""
+
+    # Render AFTER setting variable
+    return _render(doc, context)
+
+
+# ---------------------------------------------------------------------------
+# Bulk generation worker (runs inside the long-lived bulk ProcessPoolExecutor)
+# ---------------------------------------------------------------------------
+
+_worker_state = {}
+
+
+def init_bulk_worker():
+    """
+    Gives the worker process a template registry of its own, kept for the
+    lifetime of the process, so a template is loaded once per worker rather
+    than once per job.
+    """
+    _worker_state["templates"] = TemplateRegistry()
+
+
+def render_bulk_row(template_path, remote_template_path, category, file_id, row_id, row):
+    """Returns (file_name, docx bytes) for one row of a bulk job"""
+    templates = _worker_state["templates"]
+    if remote_template_path and not os.path.exists(remote_template_path):
+        remote_template_path = None
+
+    context = docx_context(row)
+
+    data = render_docx(
+        templates.get(template_path),
+        context,
+        remote_template=templates.stream(remote_template_path) if remote_template_path else None
+    )
+    file_name = docx_file_name(context, category, f"record_{file_id}_{row_id}")
+    return file_name, data
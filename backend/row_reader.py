@@ -0,0 +1,282 @@
+"""
+Streaming access to uploaded workbooks, for callers that need the header or
+a single row rather than every sheet in memory.
+
+Excel files are read with openpyxl's read-only mode and CSV files in pandas
+chunks. Rows are keyed by the same column names parse_workbook() produces
+(pandas' "Unnamed: n" / "Name.1" naming, then normalize_columns) and are
+numbered the same way: the first row is the header, blank rows in the
+middle count, trailing blank rows do not.
+
+iter_rows() yields the cells' own values: an empty cell is None, and a whole
+number stays an int even in a column with gaps. StreamedWorkbook converts
+its rows to what parse_workbook() would hold (see column_kinds()), so a
+document rendered from either is the same.
+"""
+import math
+import os
+from contextlib import closing, contextmanager
+from datetime import datetime
+from functools import lru_cache
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from workbook_cache import file_signature, find_checklist_sheet, normalize_columns
+
+
+STREAMABLE_EXTENSIONS = {"xlsx", "xlsm", "csv"}
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def file_extension(file_path):
+    return file_path.lower().split(".")[-1]
+
+
+def can_stream(file_path):
+    return file_extension(file_path) in STREAMABLE_EXTENSIONS
+
+
+def _header_names(values):
+    """Column names as pandas derives them from a header row"""
+    values = list(values)
+    # Formatted but empty cells past the last heading are not columns
+    while values and values[-1] is None:
+        values.pop()
+
+    names = [f"Unnamed: {i}" if v is None else str(v) for i, v in enumerate(values)]
+
+    counts = {}
+    for i, name in enumerate(names):
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[name] = count + 1
+            name = f"{names[i]}.{count}"
+            count = counts.get(name, 0)
+        names[i] = name
+        counts[name] = count + 1
+
+    return normalize_columns(names)
+
+
+def _read_csv(file_path, **kwargs):
+    try:
+        return pd.read_csv(file_path, encoding="utf-8", **kwargs)
+    except UnicodeDecodeError:
+        return pd.read_csv(file_path, encoding="latin1", **kwargs)
+
+
+@contextmanager
+def _open_workbook(file_path):
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        yield wb
+    finally:
+        wb.close()
+
+
+def sheet_names(file_path):
+    if file_extension(file_path) == "csv":
+        return [os.path.basename(file_path)]
+    with _open_workbook(file_path) as wb:
+        return list(wb.sheetnames)
+
+
+def _worksheet(wb, sheet_name):
+    ws = wb[sheet_name] if sheet_name else wb.worksheets[0]
+    # Some exporters write a wrong <dimension>; read what is actually there
+    ws.reset_dimensions()
+    return ws
+
+
+def read_header(file_path, sheet_name=None):
+    """Normalized column names of a sheet (the first one by default), reading only its first row"""
+    if file_extension(file_path) == "csv":
+        return normalize_columns(_read_csv(file_path, nrows=0).columns)
+
+    with _open_workbook(file_path) as wb:
+        for values in _worksheet(wb, sheet_name).iter_rows(values_only=True):
+            return _header_names(values)
+    return []
+
+
+def read_vertical_fields(file_path, sheet_name=None):
+    """
+    Field names (first column) of a vertical ISMS sheet, and whether any
+    record column follows them; nothing past the second column is read.
+    """
+    fields, has_records = [], False
+    with _open_workbook(file_path) as wb:
+        for values in _worksheet(wb, sheet_name).iter_rows(max_col=2, values_only=True):
+            if values and values[0] is not None:
+                fields.append(str(values[0]).strip())
+            if len(values) > 1 and values[1] is not None:
+                has_records = True
+    return fields, has_records
+
+
+def _excel_rows(file_path, sheet_name):
+    with _open_workbook(file_path) as wb:
+        rows = _worksheet(wb, sheet_name).iter_rows(values_only=True)
+
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = _header_names(header)
+        width = len(columns)
+
+        blank = []
+        for values in rows:
+            values = tuple(values[:width]) + (None,) * (width - len(values))
+            record = dict(zip(columns, values))
+            if all(v is None for v in values):
+                # Held back until a later row shows it is not trailing
+                blank.append(record)
+                continue
+            yield from blank
+            blank.clear()
+            yield record
+
+
+def _csv_rows(file_path):
+    for chunk in _read_csv(file_path, chunksize=DEFAULT_CHUNK_SIZE):
+        chunk.columns = normalize_columns(chunk.columns)
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        yield from chunk.to_dict(orient="records")
+
+
+def iter_rows(file_path, sheet_name=None):
+    """Yields each data row of a sheet as a dict"""
+    if file_extension(file_path) == "csv":
+        return _csv_rows(file_path)
+    return _excel_rows(file_path, sheet_name)
+
+
+def iter_chunks(file_path, sheet_name=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields the data rows of a sheet in lists of up to ``chunk_size``"""
+    chunk = []
+    for record in iter_rows(file_path, sheet_name):
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# What pandas makes of a column, as far as the values of its rows go
+FLOAT, INT, BOOL, DATETIME, OBJECT = "float", "int", "bool", "datetime", "object"
+
+
+def _cell_type(value, excel):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return bool
+    if isinstance(value, float):
+        # pandas' Excel reader turns whole floats into ints before inferring
+        return int if excel and value.is_integer() else float
+    if isinstance(value, int):
+        return int
+    if isinstance(value, datetime):
+        return datetime
+    return object
+
+
+def _column_kind(types, has_gap, excel):
+    if not types:
+        return FLOAT
+    # The Excel reader counts bools as numbers; read_csv keeps gappy bools as objects
+    numbers = {int, float, bool} if excel else {int, float}
+    if types <= numbers:
+        if has_gap or float in types:
+            return FLOAT
+        return INT if int in types else BOOL
+    if types == {bool}:
+        return OBJECT if has_gap else BOOL
+    if types == {datetime}:
+        return DATETIME
+    return OBJECT
+
+
+@lru_cache(maxsize=64)
+def _column_kinds(file_path, sheet_name, signature):
+    excel = file_extension(file_path) != "csv"
+    types, gaps = {}, set()
+    for record in iter_rows(file_path, sheet_name):
+        for column, value in record.items():
+            kind = _cell_type(value, excel)
+            if kind is None:
+                gaps.add(column)
+            else:
+                types.setdefault(column, set()).add(kind)
+    return {
+        column: _column_kind(types.get(column, set()), column in gaps, excel)
+        for column in read_header(file_path, sheet_name)
+    }
+
+
+def column_kinds(file_path, sheet_name=None):
+    """
+    ``{column: kind}`` of a sheet: the dtype parse_workbook() ends up with
+    for each column (int with gaps -> float, bools with gaps -> float in
+    Excel, ...). Takes one pass over the sheet, once per version of the file.
+    """
+    return _column_kinds(os.path.abspath(file_path), sheet_name, file_signature(file_path))
+
+
+def as_parsed(value, kind):
+    """A cell's own value as the parsed DataFrame holds it"""
+    if kind == DATETIME:
+        return pd.NaT if value is None else pd.Timestamp(value)
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return float("nan")
+    if kind == FLOAT:
+        return float(value)
+    if kind == INT:
+        return int(value)
+    if kind == OBJECT and isinstance(value, float) and value.is_integer():
+        # Whole floats are ints in Excel (see _cell_type); a CSV column mixing
+        # floats and text is read as text, so there is no float to see here
+        return int(value)
+    return value
+
+
+class StreamedWorkbook:
+    """
+    The single-row lookups of ParsedWorkbook, answered by reading the file
+    up to the row in question instead of parsing every sheet. Rows come
+    back with the values parse_workbook() would give them.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.sheet_names = sheet_names(file_path)
+
+    def checklist_sheet_name(self, category):
+        return find_checklist_sheet(self.sheet_names, category)
+
+    def columns(self, sheet_name):
+        return read_header(self.file_path, sheet_name)
+
+    def _parsed(self, kinds, record):
+        return {column: as_parsed(value, kinds.get(column)) for column, value in record.items()}
+
+    def row(self, sheet_name, row_id):
+        if row_id < 1:
+            return None
+        kinds = column_kinds(self.file_path, sheet_name)
+        with closing(iter_rows(self.file_path, sheet_name)) as rows:
+            for n, record in enumerate(rows, start=1):
+                if n == row_id:
+                    return {"id": row_id, **self._parsed(kinds, record)}
+        return None
+
+    def first_match(self, sheet_name, column, value):
+        kinds = column_kinds(self.file_path, sheet_name)
+        kind = kinds.get(column)
+        with closing(iter_rows(self.file_path, sheet_name)) as rows:
+            for record in rows:
+                if as_parsed(record.get(column), kind) == value:
+                    return self._parsed(kinds, record)
+        return None
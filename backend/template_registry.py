@@ -0,0 +1,136 @@
+"""
+DOCX templates kept in memory, one registry per process.
+
+docxtpl re-reads the template, cleans up its XML and compiles it with Jinja
+on every render. The registry keeps the template bytes together with those
+cleaned-up and compiled forms, and hands out a fresh PreparedTemplate for
+each render (rendering mutates the document). A template is reloaded when
+its file changes on disk.
+"""
+import hashlib
+import io
+import os
+import threading
+
+from docxtpl import DocxTemplate
+from jinja2 import Environment
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class _CompilingEnvironment(Environment):
+    """Jinja environment that compiles each distinct template source once"""
+
+    def __init__(self):
+        super().__init__()
+        self._compiled = {}
+
+    def from_string(self, source, globals=None, template_class=None):
+        if globals is not None or template_class is not None:
+            return super().from_string(source, globals, template_class)
+
+        template = self._compiled.get(source)
+        if template is None:
+            template = self._compiled[source] = super().from_string(source)
+        return template
+
+
+class TemplateEntry:
+    """One template file: its bytes and everything derived from them"""
+
+    def __init__(self, path):
+        self.path = path
+        self.signature = _signature(path)
+        with open(path, "rb") as f:
+            self.data = f.read()
+        self.digest = hashlib.sha256(self.data).hexdigest()
+        self.patched_xml = {}
+        self.jinja_env = _CompilingEnvironment()
+
+    def warm(self):
+        """Fills the XML and Jinja caches by rendering once with an empty context"""
+        try:
+            PreparedTemplate(self).render({})
+        except Exception:
+            # Templates that need real data still got patched and compiled
+            pass
+
+
+class PreparedTemplate(DocxTemplate):
+    """DocxTemplate that reuses its TemplateEntry's cleaned-up XML and compiled Jinja"""
+
+    def __init__(self, entry):
+        super().__init__(io.BytesIO(entry.data))
+        self.entry = entry
+
+    def patch_xml(self, src_xml):
+        patched = self.entry.patched_xml.get(src_xml)
+        if patched is None:
+            patched = self.entry.patched_xml[src_xml] = super().patch_xml(src_xml)
+        return patched
+
+    def render(self, context, jinja_env=None, autoescape=False):
+        # autoescape flips a flag on the environment, so it never gets the shared one
+        if jinja_env is None and not autoescape:
+            jinja_env = self.entry.jinja_env
+        super().render(context, jinja_env, autoescape)
+
+    def map_tree(self, tree):
+        # Detaching the populated template body makes lxml migrate every node
+        # into a new document (seconds on the larger templates); emptying it
+        # first leaves nothing to migrate. The output is byte-for-byte the same.
+        root = self.docx._element
+        body = root.body
+        body.clear()
+        root.replace(body, tree)
+
+
+class TemplateRegistry:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    def entry(self, path):
+        path = os.path.abspath(path)
+        signature = _signature(path)
+
+        entry = self._entries.get(path)
+        if entry is not None and entry.signature == signature:
+            self.hits += 1
+            return entry
+
+        entry = TemplateEntry(path)
+        with self._lock:
+            self._entries[path] = entry
+            self.loads += 1
+        return entry
+
+    def get(self, path):
+        """A fresh, render-ready copy of the template at ``path``"""
+        return PreparedTemplate(self.entry(path))
+
+    def stream(self, path):
+        """The template's bytes as a file-like object, e.g. for a sub-document"""
+        return io.BytesIO(self.entry(path).data)
+
+    def preload(self, paths, warm=False):
+        """Loads every existing template in ``paths``; ``warm`` also pre-parses them"""
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            entry = self.entry(path)
+            if warm:
+                entry.warm()
+
+    def stats(self):
+        return {
+            "templates": len(self._entries),
+            "bytes": sum(len(e.data) for e in self._entries.values()),
+            "hits": self.hits,
+            "loads": self.loads,
+        }
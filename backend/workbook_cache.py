@@ -0,0 +1,340 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+MASTER_SHEET_NAMES = {
+    "QMS": "QMS 2025",
+    "EMS": "EMS 2025",
+    "OHSMS": "OHSMS 2025",
+    "IMS": "IMS 2025",
+}
+
+# Parsed copy of an upload, "<sha256 of the upload's path>.parsed.pkl" in
+# PARSED_DIR. Sidecars are unpickled, so they must never live where users can
+# write files: keep PARSED_DIR outside the uploads tree.
+PARSED_DIR = os.getenv("PARSED_DIR", "parsed")
+SIDECAR_SUFFIX = ".parsed.pkl"
+SIDECAR_VERSION = 1
+
+
+def normalize_columns(columns):
+    """Same column cleanup the upload and generate routes have always applied"""
+    return [str(c).strip().replace(" ", "_").replace("/", "_") for c in columns]
+
+
+def find_checklist_sheet(sheet_names, category):
+    candidates = [s for s in sheet_names if category in s and "Checklist" in s]
+    return candidates[0] if candidates else None
+
+
+def excel_engine(ext):
+    if ext in ["xlsx", "xlsm"]:
+        return "openpyxl"
+    if ext == "xls":
+        return "xlrd"
+    return None
+
+
+def vertical_records(df_raw):
+    """
+    Turns a headerless vertical sheet (column 0 = field names,
+    columns 1..N = one record each) into a regular DataFrame.
+    """
+    df_raw = df_raw.dropna(how="all")
+
+    if df_raw.shape[1] < 2:
+        raise ValueError("Excel must have at least two columns (field, value)")
+
+    keys = df_raw.iloc[:, 0].astype(str).str.strip()
+    values = df_raw.iloc[:, 1:]
+
+    records = []
+    for col_idx in range(values.shape[1]):
+        records.append(dict(zip(keys, values.iloc[:, col_idx].tolist())))
+
+    df = pd.DataFrame(records)
+    df.columns = [c.strip().replace(" ", "_") for c in df.columns]
+    return df
+
+
+class ParsedWorkbook:
+    """
+    Every sheet of an uploaded file, parsed once with normalized columns.
+
+    The DataFrames are shared between requests: callers must copy before
+    mutating them.
+    """
+
+    def __init__(self, sheet_names, sheets, raw=None, records=None, source=None):
+        self.sheet_names = sheet_names
+        self.sheets = sheets
+        # Headerless first sheet and its records, only for vertical ISMS files
+        self.raw = raw
+        self.records = records
+        # (size, mtime_ns) of the file this was parsed from
+        self.source = source
+        # (sheet, column) -> {value: offset of the first row holding it}
+        self._lookup = {}
+
+    def first_sheet(self):
+        return self.sheets[self.sheet_names[0]]
+
+    def master_sheet_name(self, category):
+        name = MASTER_SHEET_NAMES.get(category)
+        if name in self.sheets:
+            return name
+        return self.sheet_names[0]
+
+    def master(self, category):
+        return self.sheets[self.master_sheet_name(category)]
+
+    def checklist_sheet_name(self, category):
+        return find_checklist_sheet(self.sheet_names, category)
+
+    def checklist(self, category):
+        name = self.checklist_sheet_name(category)
+        return self.sheets[name] if name else None
+
+    # Single-row lookups; row_reader.StreamedWorkbook offers the same three
+
+    def columns(self, sheet_name):
+        return list(self.sheets[sheet_name].columns)
+
+    def _record(self, sheet_name, offset):
+        return self.sheets[sheet_name].iloc[offset:offset + 1].to_dict(orient="records")[0]
+
+    def row(self, sheet_name, row_id):
+        """Row ``row_id`` (1-based, as the dashboard numbers them) with its "id", or None"""
+        # Row ids are positions, so this is an offset lookup, not a search
+        if not 1 <= row_id <= len(self.sheets[sheet_name]):
+            return None
+        return {"id": row_id, **self._record(sheet_name, row_id - 1)}
+
+    def lookup_index(self, sheet_name, column):
+        """
+        ``{value: offset}`` of the first row holding each value of a column,
+        built on first use and kept for as long as the workbook is cached.
+        Empty cells are left out, as ``df[column] == value`` never matches them.
+        """
+        key = (sheet_name, column)
+        index = self._lookup.get(key)
+        if index is None:
+            index = {}
+            for offset, value in enumerate(self.sheets[sheet_name][column].tolist()):
+                if value is not None and value == value:
+                    index.setdefault(value, offset)
+            # Two requests may race to build the same index; either result is correct
+            self._lookup[key] = index
+        return index
+
+    def first_match(self, sheet_name, column, value):
+        """First row whose ``column`` equals ``value``, or None"""
+        offset = self.lookup_index(sheet_name, column).get(value)
+        if offset is None:
+            return None
+        return self._record(sheet_name, offset)
+
+    def frames(self):
+        frames = list(self.sheets.values())
+        if self.raw is not None:
+            frames.append(self.raw)
+        if self.records is not None:
+            frames.append(self.records)
+        return frames
+
+    @property
+    def nbytes(self):
+        return int(sum(df.memory_usage(index=True, deep=True).sum() for df in self.frames()))
+
+
+def file_signature(file_path):
+    st = os.stat(file_path)
+    return (st.st_size, st.st_mtime_ns)
+
+
+def parse_workbook(file_path, vertical=False):
+    ext = file_path.lower().split(".")[-1]
+    source = file_signature(file_path)
+
+    if ext == "csv":
+        if vertical:
+            raise ValueError("ISMS vertical format supports Excel only")
+        try:
+            df = pd.read_csv(file_path, encoding="utf-8")
+        except UnicodeDecodeError:
+            df = pd.read_csv(file_path, encoding="latin1")
+        df.columns = normalize_columns(df.columns)
+        name = os.path.basename(file_path)
+        return ParsedWorkbook([name], {name: df}, source=source)
+
+    engine = excel_engine(ext)
+    if engine is None:
+        raise ValueError(f"Unsupported file type: {ext}")
+
+    with pd.ExcelFile(file_path, engine=engine) as xl:
+        sheet_names = list(xl.sheet_names)
+        sheets = {}
+        for name in sheet_names:
+            df = xl.parse(name)
+            df.columns = normalize_columns(df.columns)
+            sheets[name] = df
+
+        raw = records = None
+        if vertical:
+            raw = xl.parse(sheet_names[0], header=None, keep_default_na=False)
+            # Too few columns is reported by upload validation, not here
+            if raw.shape[1] >= 2:
+                records = vertical_records(raw)
+
+    return ParsedWorkbook(sheet_names, sheets, raw=raw, records=records, source=source)
+
+
+def sidecar_path(file_path):
+    key = hashlib.sha256(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+    return os.path.join(PARSED_DIR, key + SIDECAR_SUFFIX)
+
+
+def write_sidecar(workbook, file_path):
+    """Persist a parsed workbook for its upload, atomically"""
+    path = sidecar_path(file_path)
+    os.makedirs(PARSED_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    payload = {
+        "version": SIDECAR_VERSION,
+        "vertical": workbook.raw is not None,
+        "source": workbook.source,
+        "sheet_names": workbook.sheet_names,
+        "sheets": workbook.sheets,
+        "raw": workbook.raw,
+        "records": workbook.records,
+    }
+    with open(tmp_path, "wb") as f:
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def read_sidecar(file_path, vertical=False):
+    """
+    The parsed workbook stored for an upload, or None when there is
+    none or it no longer matches the file on disk.
+    """
+    path = sidecar_path(file_path)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, "rb") as f:
+            payload = pickle.load(f)
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable sidecar {path}: {e}")
+        return None
+
+    if (
+        payload.get("version") != SIDECAR_VERSION
+        or payload.get("vertical") != vertical
+        or payload.get("source") != file_signature(file_path)
+    ):
+        return None
+
+    return ParsedWorkbook(
+        payload["sheet_names"],
+        payload["sheets"],
+        raw=payload["raw"],
+        records=payload["records"],
+        source=payload["source"],
+    )
+
+
+def load_parsed_workbook(file_path, vertical=False):
+    """Sidecar if there is a current one, otherwise parse the original and write it"""
+    workbook = read_sidecar(file_path, vertical=vertical)
+    if workbook is not None:
+        return workbook
+
+    workbook = parse_workbook(file_path, vertical=vertical)
+    try:
+        write_sidecar(workbook, file_path)
+    except OSError as e:
+        print(f"⚠️ Could not write sidecar for {file_path}: {e}")
+    return workbook
+
+
+class WorkbookCache:
+    """
+    Process-wide LRU of parsed uploads, keyed by UserFile.id.
+
+    An entry is only served while the file on disk still has the size and
+    mtime it had when parsed. Uploads live at content-addressed paths and
+    are never rewritten in place, so nothing needs invalidating by hand: a
+    changed file is a new path, and one that changed anyway is re-read.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, max_entries=32):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+
+    def get(self, file_id, file_path, vertical=False):
+        workbook = self.peek(file_id, file_path, vertical=vertical)
+        if workbook is not None:
+            return workbook
+
+        workbook = load_parsed_workbook(file_path, vertical=vertical)
+        self._put((file_id, vertical), (os.path.abspath(file_path), *workbook.source), workbook)
+        return workbook
+
+    def peek(self, file_id, file_path, vertical=False):
+        """The cached workbook if it is current, without loading anything on a miss"""
+        key = (file_id, vertical)
+        signature = (os.path.abspath(file_path), *file_signature(file_path))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                return entry[1]
+        return None
+
+    def put(self, file_id, file_path, workbook, vertical=False):
+        """Seed the cache with a workbook that was just parsed elsewhere"""
+        self._put((file_id, vertical), (os.path.abspath(file_path), *workbook.source), workbook)
+
+    def _put(self, key, signature, workbook):
+        size = workbook.nbytes
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (signature, workbook, size)
+            self._total_bytes += size
+            while self._entries and (
+                self._total_bytes > self.max_bytes or len(self._entries) > self.max_entries
+            ):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+            }
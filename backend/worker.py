@@ -0,0 +1,18 @@
+"""
+Runs generation jobs outside the web process:
+
+    JOB_WORKER_THREADS=0 gunicorn app:app    # web only enqueues (see gunicorn.conf.py)
+    python worker.py                         # one or more of these run the jobs
+"""
+import os
+
+# Importing app must not start its own in-process workers
+os.environ["JOB_WORKER_THREADS"] = "0"
+
+from app import app
+from jobs import run_worker
+
+
+if __name__ == "__main__":
+    print("👷 Generation job worker started")
+    run_worker(app)